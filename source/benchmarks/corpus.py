@@ -0,0 +1,126 @@
+import random
+
+
+# identifier characters, tokenizer does not take 'z' as part of keyword
+_IDENTIFIER_CHARACTERS = "abcdefghijklmnopqrstuvwxy"
+
+_OPERATORS = ("+", "-", "*", "<", "==")
+
+_STRING_CHARACTERS = _IDENTIFIER_CHARACTERS + "ABCDEFGHIJKLMNOPQRSTUVWXY0123456789 .-_!?"
+
+
+class CorpusShape:
+    """
+    Parameters of generated source. Every top-level expression is one of the shapes below,
+    picked at random with weights given by *_weight parameters
+    """
+    def __init__(self, expression_count=2000, nesting_depth=8, send_chain_length=12, slot_count=16,
+                 string_length=256, nested_weight=1, chain_weight=2, object_weight=1, string_weight=1):
+        self.expression_count = expression_count
+        self.nesting_depth = nesting_depth
+        self.send_chain_length = send_chain_length
+        self.slot_count = slot_count
+        self.string_length = string_length
+
+        self.nested_weight = nested_weight
+        self.chain_weight = chain_weight
+        self.object_weight = object_weight
+        self.string_weight = string_weight
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class CorpusGenerator:
+    """Generates reproducible synthetic source, same shape and seed always give same text"""
+    def __init__(self, shape, seed=0):
+        self._shape = shape
+        self._random = random.Random(seed)
+
+        self._generators = (
+            (self._generate_nested, shape.nested_weight),
+            (self._generate_chain, shape.chain_weight),
+            (self._generate_object, shape.object_weight),
+            (self._generate_string_send, shape.string_weight),
+        )
+
+    def generate(self):
+        functions = [function for function, _ in self._generators]
+        weights = [weight for _, weight in self._generators]
+
+        expressions = [
+            self._random.choices(functions, weights)[0]() + ","
+            for _ in range(self._shape.expression_count)
+        ]
+
+        # source must not end with whitespace
+        return "\n".join(expressions)
+
+    def _generate_identifier(self):
+        return "".join(self._random.choices(_IDENTIFIER_CHARACTERS, k=self._random.randint(1, 8)))
+
+    def _generate_simple_term(self):
+        choice = self._random.randrange(3)
+
+        if choice == 0:
+            return str(self._random.randrange(1 << 16))
+        if choice == 1:
+            return self._generate_identifier()
+
+        return '"' + self._generate_identifier() + '"'
+
+    def _generate_nested(self, depth=None):
+        """Send whose arguments are sends, nested to configured depth"""
+        if depth is None:
+            depth = self._shape.nesting_depth
+
+        if depth == 0:
+            return self._generate_simple_term()
+
+        if self._random.randrange(2):
+            arguments = ", ".join(self._generate_nested(depth - 1) for _ in range(self._random.randint(1, 2)))
+
+            return "{}:{}({})".format(self._generate_simple_term(), self._generate_identifier(), arguments)
+
+        return "({} {} {})".format(
+            self._generate_simple_term(),
+            self._random.choice(_OPERATORS),
+            self._generate_nested(depth - 1)
+        )
+
+    def _generate_chain(self):
+        """Long chain of unary and keyword sends to one receiver"""
+        parts = [self._generate_identifier()]
+
+        for _ in range(self._shape.send_chain_length):
+            parts.append(":" + self._generate_identifier())
+
+            if self._random.randrange(2):
+                parts.append("(" + self._generate_simple_term() + ")")
+
+        return "".join(parts)
+
+    def _generate_object(self):
+        """Object literal with many slots and short code"""
+        slots = []
+
+        for index in range(self._shape.slot_count):
+            slot = "s{}({})".format(index, self._random.randrange(3))
+
+            if self._random.randrange(2):
+                slot += " = " + self._random.choice((str(index), '"' + self._generate_identifier() + '"'))
+
+            slots.append(slot + ",")
+
+        code = " ".join(self._generate_nested(2) + "," for _ in range(self._random.randint(0, 3)))
+
+        return "(; {} ; {} ;)".format(" ".join(slots), code) if code else "(; {} ;;)".format(" ".join(slots))
+
+    def _generate_string_send(self):
+        text = "".join(self._random.choices(_STRING_CHARACTERS, k=self._shape.string_length))
+
+        return '{}:{}("{}")'.format(self._generate_identifier(), self._generate_identifier(), text)
+
+
+def generate_corpus(shape=None, seed=0):
+    return CorpusGenerator(shape or CorpusShape(), seed).generate()
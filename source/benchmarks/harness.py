@@ -0,0 +1,287 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from source.benchmarks.corpus import CorpusShape, generate_corpus
+from source.compiler.arena import from_tree
+from source.compiler.optimization import PeepholeOptimizer
+from source.compiler.parsing import Parser, PARSER_CLASSES
+from source.compiler.serialization import get_module_bytes
+from source.compiler.tokenization import Tokenizer, TokenizerEngines, TokenTypes, token_mask
+
+
+RESULTS_FORMAT_VERSION = 1
+
+# stages slower than baseline by more than this ratio are reported as regressions
+DEFAULT_REGRESSION_THRESHOLD = 1.05
+
+# every token type except EOF, so token check loop stops at end of tokens
+_ANY_TOKEN_MASK = token_mask(*(token_type for token_type in TokenTypes if token_type is not TokenTypes.EOF))
+
+
+class Stage:
+    """
+    One measured compiler stage. Prepare builds input of stage (outside of measurement),
+    run does measured work on it and returns output
+    """
+    def __init__(self, name, prepare, run):
+        self.name = name
+        self.prepare = prepare
+        self.run = run
+
+
+class BenchmarkRunner:
+    def __init__(self, source_code, parser_class=Parser, repeat=5):
+        self._source_code = source_code
+        self._parser_class = parser_class
+        self._repeat = repeat
+
+        # sizes used to turn times into rates, counted once before measurement
+        self._source_bytes = len(source_code.encode("utf-8"))
+        self._tokens = Tokenizer(TokenizerEngines.REGEX).tokenize(source_code)
+        self._collapsed_tokens = Tokenizer(TokenizerEngines.REGEX, collapse_whitespace=True).tokenize(source_code)
+        self._root_code = parser_class(list(self._tokens)).parse_root_code()
+        self._arena = from_tree(self._root_code)
+        self._node_count = len(self._arena)
+        self._module_bytes = len(get_module_bytes(self._root_code))
+
+        self._stages = (
+            Stage("tokenize", lambda: None, self._run_tokenize),
+            Stage("tokenize_character", lambda: None, self._run_tokenize_character),
+            Stage("tokenize_buffer", lambda: None, self._run_tokenize_buffer),
+            Stage("parse_checks", lambda: self._parser_class(list(self._tokens)), self._run_parse_checks),
+            Stage("parse", lambda: list(self._tokens), self._run_parse),
+            Stage("parse_collapsed", lambda: list(self._collapsed_tokens), self._run_parse_collapsed),
+            Stage("build_nodes", lambda: self._arena, self._run_build_nodes),
+            Stage("emit", lambda: None, self._run_emit),
+            Stage("emit_optimized", lambda: None, self._run_emit_optimized),
+        )
+
+    def _run_tokenize(self, _):
+        return Tokenizer(TokenizerEngines.REGEX).tokenize(self._source_code)
+
+    def _run_tokenize_character(self, _):
+        return Tokenizer(TokenizerEngines.CHARACTER).tokenize(self._source_code)
+
+    def _run_tokenize_buffer(self, _):
+        return Tokenizer(TokenizerEngines.REGEX).tokenize_to_buffer(self._source_code)
+
+    def _run_parse_checks(self, parser):
+        # micro-stage: every token goes through the same type check and pull parser does for it,
+        # but no nodes are built, so this is per-token overhead of parser itself
+        check_consume_token_type = parser._check_consume_token_type
+
+        while check_consume_token_type(_ANY_TOKEN_MASK):
+            pass
+
+        return parser
+
+    def _run_parse(self, tokens):
+        return self._parser_class(tokens).parse_root_code()
+
+    def _run_parse_collapsed(self, tokens):
+        return self._parser_class(tokens, collapsed_whitespace=True).parse_root_code()
+
+    def _run_build_nodes(self, arena):
+        # only node objects are created here, so retained memory of this stage is memory of tree itself
+        return arena.to_tree()
+
+    def _run_emit(self, _):
+        return get_module_bytes(self._root_code)
+
+    def _run_emit_optimized(self, _):
+        return get_module_bytes(self._root_code, PeepholeOptimizer())
+
+    def get_stage_names(self):
+        return [stage.name for stage in self._stages]
+
+    def run(self, stage_names=None):
+        """Measures selected (by default all) stages, returns results dictionary"""
+        stages = [stage for stage in self._stages if stage_names is None or stage.name in stage_names]
+
+        return {
+            "format_version": RESULTS_FORMAT_VERSION,
+            "environment": {
+                "python": platform.python_version(),
+                "implementation": platform.python_implementation(),
+                "machine": platform.machine(),
+            },
+            "corpus": {
+                "source_bytes": self._source_bytes,
+                "tokens": len(self._tokens),
+                "nodes": self._node_count,
+                "module_bytes": self._module_bytes,
+            },
+            "stages": {stage.name: self._measure_stage(stage) for stage in stages},
+        }
+
+    def _measure_stage(self, stage):
+        timings = []
+
+        for _ in range(self._repeat):
+            stage_input = stage.prepare()
+
+            start = time.perf_counter()
+            stage.run(stage_input)
+            timings.append(time.perf_counter() - start)
+
+        best = min(timings)
+        peak_memory, retained_memory = self._measure_memory(stage)
+
+        return {
+            "best_seconds": best,
+            "median_seconds": statistics.median(timings),
+            "tokens_per_second": len(self._tokens) / best,
+            "nodes_per_second": self._node_count / best,
+            "source_bytes_per_second": self._source_bytes / best,
+            "module_bytes_per_second": self._module_bytes / best,
+            "peak_memory_bytes": peak_memory,
+            "retained_memory_bytes": retained_memory,
+            "retained_bytes_per_node": retained_memory / self._node_count,
+        }
+
+    def _measure_memory(self, stage):
+        """Returns peak memory of stage and memory still held by its output"""
+        # tracing slows everything down, so memory is measured in its own run
+        stage_input = stage.prepare()
+
+        tracemalloc.start()
+        try:
+            output = stage.run(stage_input)
+            retained, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        del output
+
+        return peak, retained
+
+
+def compare_results(baseline, current, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """
+    Returns list of (stage name, baseline seconds, current seconds, ratio, is regression) for stages
+    present in both results
+    """
+    comparison = []
+
+    for stage_name, current_stage in current["stages"].items():
+        baseline_stage = baseline["stages"].get(stage_name)
+
+        if baseline_stage is None:
+            continue
+
+        ratio = current_stage["best_seconds"] / baseline_stage["best_seconds"]
+
+        comparison.append((
+            stage_name,
+            baseline_stage["best_seconds"],
+            current_stage["best_seconds"],
+            ratio,
+            ratio > threshold
+        ))
+
+    return comparison
+
+
+def format_results(results):
+    lines = ["corpus: {source_bytes} bytes, {tokens} tokens, {nodes} nodes".format(**results["corpus"])]
+
+    for stage_name, stage in results["stages"].items():
+        lines.append(
+            "{:<18} {:9.4f} s  {:12.0f} tokens/s  {:12.0f} nodes/s  {:14.0f} bytes/s  peak {:10d} B  "
+            "retained {:7.1f} B/node".format(
+                stage_name,
+                stage["best_seconds"],
+                stage["tokens_per_second"],
+                stage["nodes_per_second"],
+                stage["source_bytes_per_second"],
+                stage["peak_memory_bytes"],
+                stage["retained_bytes_per_node"]
+            )
+        )
+
+    return "\n".join(lines)
+
+
+def format_comparison(comparison):
+    lines = []
+
+    for stage_name, baseline_seconds, current_seconds, ratio, is_regression in comparison:
+        lines.append("{:<18} {:9.4f} s -> {:9.4f} s  x{:.3f}{}".format(
+            stage_name,
+            baseline_seconds,
+            current_seconds,
+            ratio,
+            "  REGRESSION" if is_regression else ""
+        ))
+
+    return "\n".join(lines)
+
+
+def main(arguments=None):
+    default_shape = CorpusShape()
+
+    argument_parser = argparse.ArgumentParser(description="Measures tokenizer, parser and emitter on synthetic corpus")
+
+    argument_parser.add_argument("--expressions", type=int, default=default_shape.expression_count)
+    argument_parser.add_argument("--nesting-depth", type=int, default=default_shape.nesting_depth)
+    argument_parser.add_argument("--chain-length", type=int, default=default_shape.send_chain_length)
+    argument_parser.add_argument("--slots", type=int, default=default_shape.slot_count)
+    argument_parser.add_argument("--string-length", type=int, default=default_shape.string_length)
+    argument_parser.add_argument("--seed", type=int, default=0)
+    argument_parser.add_argument("--repeat", type=int, default=5)
+    argument_parser.add_argument("--parser", choices=sorted(PARSER_CLASSES), default="recursive")
+    argument_parser.add_argument("--stage", action="append", help="measure only given stage (can be repeated)")
+    argument_parser.add_argument("--output", help="save results as JSON into this file")
+    argument_parser.add_argument("--baseline", help="compare with results previously saved by --output")
+    argument_parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+
+    options = argument_parser.parse_args(arguments)
+
+    shape = CorpusShape(
+        expression_count=options.expressions,
+        nesting_depth=options.nesting_depth,
+        send_chain_length=options.chain_length,
+        slot_count=options.slots,
+        string_length=options.string_length
+    )
+
+    runner = BenchmarkRunner(
+        generate_corpus(shape, options.seed),
+        parser_class=PARSER_CLASSES[options.parser],
+        repeat=options.repeat
+    )
+
+    results = runner.run(options.stage)
+    results["corpus"]["shape"] = shape.to_dict()
+    results["corpus"]["seed"] = options.seed
+    results["corpus"]["parser"] = options.parser
+
+    print(format_results(results))
+
+    if options.output:
+        with open(options.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        if baseline["corpus"].get("shape") != results["corpus"]["shape"]:
+            print("warning: baseline was measured on differently shaped corpus", file=sys.stderr)
+
+        comparison = compare_results(baseline, results, options.threshold)
+        print(format_comparison(comparison))
+
+        if any(is_regression for *_, is_regression in comparison):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
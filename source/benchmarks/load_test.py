@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+from source.benchmarks.corpus import CorpusShape, generate_corpus
+from source.compiler.service import CompileClient
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def generate_sources(count, shape, seed=0):
+    """Returns count different sources of given shape"""
+    return [generate_corpus(shape, seed + index) for index in range(count)]
+
+
+async def _run_connection(socket_path, sources, request_count, optimize, latencies, failures):
+    client = await CompileClient.connect_unix(socket_path)
+
+    try:
+        for index in range(request_count):
+            start = time.perf_counter()
+            _, diagnostic = await client.compile(sources[index % len(sources)], optimize)
+            latencies.append(time.perf_counter() - start)
+
+            if diagnostic is not None:
+                failures.append(diagnostic)
+    finally:
+        await client.close()
+
+
+async def run_load_test(socket_path, sources, connections=4, requests=1000, optimize=False):
+    """
+    Sends requests (split evenly over connections, each one waits for answer before sending next)
+    to service listening on socket. Returns dictionary with throughput and latency percentiles
+    """
+    latencies = []
+    failures = []
+
+    # sources are sent as bytes, so encoding is not measured
+    sources = [source.encode("utf-8") for source in sources]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _run_connection(
+            socket_path,
+            sources,
+            requests // connections + (index < requests % connections),
+            optimize,
+            latencies,
+            failures
+        )
+        for index in range(connections)
+    ))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    return {
+        "requests": len(latencies),
+        "connections": connections,
+        "failures": len(failures),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "latency_ms": {
+            "min": latencies[0] * 1000,
+            "median": statistics.median(latencies) * 1000,
+            "p90": _percentile(latencies, 0.90) * 1000,
+            "p99": _percentile(latencies, 0.99) * 1000,
+            "max": latencies[-1] * 1000,
+        },
+    }
+
+
+def format_load_results(results):
+    return "{requests} requests over {connections} connections in {seconds:.3f} s ({requests_per_second:.0f}/s), " \
+           "{failures} failed\nlatency ms: min {min:.3f}  median {median:.3f}  p90 {p90:.3f}  p99 {p99:.3f}  " \
+           "max {max:.3f}".format(**results, **results["latency_ms"])
+
+
+def main(arguments=None):
+    argument_parser = argparse.ArgumentParser(description="Measures latency and throughput of running compile service")
+
+    argument_parser.add_argument("--socket", required=True, help="Unix socket of service")
+    argument_parser.add_argument("--connections", type=int, default=4)
+    argument_parser.add_argument("--requests", type=int, default=1000)
+    argument_parser.add_argument("--sources", type=int, default=16, help="number of different sources sent")
+    argument_parser.add_argument("--expressions", type=int, default=10, help="top-level expressions per source")
+    argument_parser.add_argument("--optimize", action="store_true")
+    argument_parser.add_argument("--seed", type=int, default=0)
+    argument_parser.add_argument("--output", help="save results as JSON into this file")
+
+    options = argument_parser.parse_args(arguments)
+
+    # small sources, as editor would send them
+    shape = CorpusShape(
+        expression_count=options.expressions,
+        nesting_depth=3,
+        send_chain_length=4,
+        slot_count=4,
+        string_length=32
+    )
+
+    results = asyncio.run(run_load_test(
+        options.socket,
+        generate_sources(options.sources, shape, options.seed),
+        options.connections,
+        options.requests,
+        options.optimize
+    ))
+
+    print(format_load_results(results))
+
+    if options.output:
+        with open(options.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    return 1 if results["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,567 @@
+import enum
+from array import array
+from itertools import repeat
+
+from source.compiler.ast_nodes import BytecodeWriter, SendNode, ExplicitReturnNode, LiteralNode, \
+    MyselfNode, IntegerBox, StringBox, UnfinishedSymbolBox, CompleteSymbolBox, CodeBox, ObjectBox, NoneBox, \
+    encode_symbol, encode_integer, encode_string, translate_slot_kind
+from source.compiler.bytecodes import LiteralTags, Opcodes, SlotKindTags
+
+
+class NodeKinds(enum.IntEnum):
+    # expression nodes
+    SEND = 0
+    EXPLICIT_RETURN = 1
+    LITERAL = 2
+    MYSELF = 3
+
+    # literal boxes
+    INTEGER = 4
+    STRING = 5
+    UNFINISHED_SYMBOL = 6
+    COMPLETE_SYMBOL = 7
+    CODE = 8
+    OBJECT = 9
+    SLOT = 10
+    NONE = 11
+
+
+_NODE_KINDS_BY_VALUE = tuple(NodeKinds)
+
+# kinds whose value column holds index into constant table
+_CONSTANT_KINDS = frozenset((
+    NodeKinds.INTEGER,
+    NodeKinds.STRING,
+    NodeKinds.UNFINISHED_SYMBOL,
+    NodeKinds.COMPLETE_SYMBOL,
+))
+
+# plain integer kinds for hot loops, comparing with enum members costs attribute lookup every time
+_SEND_KIND = NodeKinds.SEND.value
+_LITERAL_KIND = NodeKinds.LITERAL.value
+_MYSELF_KIND = NodeKinds.MYSELF.value
+_INTEGER_KIND = NodeKinds.INTEGER.value
+_STRING_KIND = NodeKinds.STRING.value
+
+_VISIT_METHOD_NAMES = tuple("visit_" + kind.name.lower() for kind in NodeKinds)
+
+
+class ArenaTree:
+    """
+    Flat AST. Nodes live in parallel typed arrays and are referenced by integer id, children of node
+    are contiguous range in shared children array. Values of literals are stored once in constant table.
+
+    Children are always added before their parent, so root is node with highest id. Child ranges
+    are added in order of node ids too, so range of node ends where range of next node starts.
+    Children by kind:
+        SEND: receiver, selector (UNFINISHED_SYMBOL), parameters
+        EXPLICIT_RETURN: returned node
+        LITERAL: literal box
+        CODE: expressions
+        OBJECT: code (CODE or NONE), slots
+        SLOT: name (COMPLETE_SYMBOL), content; value holds slot kind tag byte
+    """
+    def __init__(self):
+        self._kinds = array("B")
+        self._values = array("q")
+        # one more start than there are nodes, closing range of last node
+        self._child_starts = array("I", (0,))
+        self._children = array("I")
+
+        self._constants = []
+        self._constant_indices = {}
+
+    def add_node(self, kind, value=0, children=()):
+        """Adds node and returns its id"""
+        node_id = len(self._kinds)
+
+        self._kinds.append(kind)
+        self._values.append(value)
+        self._children.extend(children)
+        self._child_starts.append(len(self._children))
+
+        return node_id
+
+    def add_constant(self, value):
+        """Adds value into constant table (once) and returns its index"""
+        # type is part of key, so that 1 and True or "1" never share entry
+        key = (type(value), value)
+
+        index = self._constant_indices.get(key)
+        if index is None:
+            index = self._constant_indices[key] = len(self._constants)
+            self._constants.append(value)
+
+        return index
+
+    def __len__(self):
+        return len(self._kinds)
+
+    def get_root(self):
+        return len(self._kinds) - 1
+
+    def get_kind(self, node_id):
+        return _NODE_KINDS_BY_VALUE[self._kinds[node_id]]
+
+    def get_value(self, node_id):
+        """Returns value of node, constant for literal kinds and raw value column for others"""
+        value = self._values[node_id]
+
+        if self._kinds[node_id] in _CONSTANT_KINDS:
+            return self._constants[value]
+
+        return value
+
+    def get_children(self, node_id):
+        return self._children[self._child_starts[node_id]:self._child_starts[node_id + 1]]
+
+    def get_child(self, node_id, position):
+        return self._children[self._child_starts[node_id] + position]
+
+    def get_child_count(self, node_id):
+        return self._child_starts[node_id + 1] - self._child_starts[node_id]
+
+    def get_columns(self):
+        """
+        Returns raw (kinds, values, child_starts, children, constants) columns, for passes which
+        loop over whole tree and cannot afford method call per node. Columns must not be modified
+        """
+        return self._kinds, self._values, self._child_starts, self._children, self._constants
+
+    def count_kinds(self):
+        """Returns dictionary of node counts by kind"""
+        return {kind: self._kinds.count(kind) for kind in NodeKinds}
+
+    def visit(self, node_id, visitor, *arguments):
+        """Calls visit_<kind>(tree, node_id, *arguments) method of visitor and returns its result"""
+        return visitor.get_visit_methods()[self._kinds[node_id]](self, node_id, *arguments)
+
+    def write_into(self, writer):
+        """Writes root code, so tree can be handed to serialization functions in place of CodeBox"""
+        ArenaCompiler().write_code(self, self.get_root(), writer)
+
+    def get_compiled(self, optimizer=None):
+        writer = BytecodeWriter(optimizer)
+        self.write_into(writer)
+
+        return writer.get_bytes()
+
+    def to_tree(self, node_id=None):
+        """Builds linked node tree back from arena, root code by default"""
+        if node_id is None:
+            node_id = self.get_root()
+
+        return _TreeBuilder().build(self, node_id)
+
+    def __getstate__(self):
+        # arrays are stored as raw bytes, which makes pickling cost close to copying memory
+        return (
+            self._kinds.tobytes(),
+            self._values.tobytes(),
+            self._child_starts.tobytes(),
+            self._children.tobytes(),
+            self._constants,
+        )
+
+    def __setstate__(self, state):
+        kinds, values, child_starts, children, constants = state
+
+        self._kinds = array("B", kinds)
+        self._values = array("q")
+        self._values.frombytes(values)
+        self._child_starts = array("I")
+        self._child_starts.frombytes(child_starts)
+        self._children = array("I")
+        self._children.frombytes(children)
+
+        self._constants = constants
+        self._constant_indices = {(type(value), value): index for index, value in enumerate(constants)}
+
+
+def from_tree(root_code):
+    """Builds arena from linked node tree (as returned by Parser.parse_root_code)"""
+    tree = ArenaTree()
+
+    _ArenaBuilder(tree).add(root_code)
+
+    return tree
+
+
+class _ArenaBuilder:
+    """Converts linked nodes into arena nodes, children first"""
+    def __init__(self, tree):
+        self._tree = tree
+
+        self._add_methods = {
+            SendNode: self._add_send,
+            ExplicitReturnNode: self._add_explicit_return,
+            LiteralNode: self._add_literal,
+            MyselfNode: self._add_myself,
+            IntegerBox: self._add_integer,
+            StringBox: self._add_string,
+            UnfinishedSymbolBox: self._add_unfinished_symbol,
+            CompleteSymbolBox: self._add_complete_symbol,
+            CodeBox: self._add_code,
+            ObjectBox: self._add_object,
+            NoneBox: self._add_none,
+            # slots of object are plain (name, kind, content) tuples
+            tuple: self._add_slot,
+        }
+
+        # nodes missing here have no children
+        self._get_children_methods = {
+            SendNode: lambda node: [node.get_receiver(), node.get_selector(), *node.get_parameters()],
+            ExplicitReturnNode: lambda node: [node.get_return_node()],
+            LiteralNode: lambda node: [node.get_literal_value()],
+            CodeBox: lambda box: box.get_value(),
+            ObjectBox: lambda box: [NoneBox() if box.get_code() is None else box.get_code(), *box.get_slots()],
+            tuple: lambda slot: [slot[0], slot[2]],
+        }
+
+    def add(self, node):
+        """
+        Adds node with all its descendants and returns its id. Nodes are walked with explicit stack,
+        so deeply nested trees do not hit recursion limit
+        """
+        add_methods = self._add_methods
+        get_children_methods = self._get_children_methods
+
+        # ids of added nodes whose parent was not added yet
+        added = []
+
+        # entries are (node, child count), child count is None until children of node are pushed
+        stack = [(node, None)]
+
+        while stack:
+            node, child_count = stack.pop()
+
+            if child_count is None:
+                get_children = get_children_methods.get(type(node))
+
+                # leaves are added right away
+                if get_children is None:
+                    added.append(add_methods[type(node)](node, ()))
+                    continue
+
+                children = get_children(node)
+
+                stack.append((node, len(children)))
+                stack.extend(zip(reversed(children), repeat(None)))
+                continue
+
+            child_ids = added[len(added) - child_count:]
+            del added[len(added) - child_count:]
+
+            added.append(add_methods[type(node)](node, child_ids))
+
+        return added[0]
+
+    def _add_send(self, node, child_ids):
+        return self._tree.add_node(NodeKinds.SEND, children=child_ids)
+
+    def _add_explicit_return(self, node, child_ids):
+        return self._tree.add_node(NodeKinds.EXPLICIT_RETURN, children=child_ids)
+
+    def _add_literal(self, node, child_ids):
+        return self._tree.add_node(NodeKinds.LITERAL, children=child_ids)
+
+    def _add_myself(self, node, child_ids):
+        return self._tree.add_node(NodeKinds.MYSELF)
+
+    def _add_integer(self, box, child_ids):
+        return self._tree.add_node(NodeKinds.INTEGER, self._tree.add_constant(box.get_value()))
+
+    def _add_string(self, box, child_ids):
+        return self._tree.add_node(NodeKinds.STRING, self._tree.add_constant(box.get_value()))
+
+    def _add_unfinished_symbol(self, box, child_ids):
+        return self._tree.add_node(NodeKinds.UNFINISHED_SYMBOL, self._tree.add_constant(box.get_value()))
+
+    def _add_complete_symbol(self, box, child_ids):
+        constant = (box.get_arity(), box.get_characters())
+
+        return self._tree.add_node(NodeKinds.COMPLETE_SYMBOL, self._tree.add_constant(constant))
+
+    def _add_code(self, box, child_ids):
+        return self._tree.add_node(NodeKinds.CODE, children=child_ids)
+
+    def _add_object(self, box, child_ids):
+        return self._tree.add_node(NodeKinds.OBJECT, children=child_ids)
+
+    def _add_slot(self, slot, child_ids):
+        _, slot_kind, _ = slot
+
+        return self._tree.add_node(NodeKinds.SLOT, translate_slot_kind(slot_kind), child_ids)
+
+    def _add_none(self, box, child_ids):
+        return self._tree.add_node(NodeKinds.NONE)
+
+
+class ArenaVisitor:
+    """
+    Base of arena visitors. Every visit method gets tree and node id (and any extra arguments given to
+    ArenaTree.visit), generic_visit visits all children of node
+    """
+    _visit_methods = None
+
+    def get_visit_methods(self):
+        """Returns bound visit methods indexed by node kind"""
+        # looked up once per visitor instead of once per visited node
+        if self._visit_methods is None:
+            self._visit_methods = tuple(getattr(self, method_name) for method_name in _VISIT_METHOD_NAMES)
+
+        return self._visit_methods
+
+    def generic_visit(self, tree, node_id, *arguments):
+        for child_id in tree.get_children(node_id):
+            tree.visit(child_id, self, *arguments)
+
+    visit_send = generic_visit
+    visit_explicit_return = generic_visit
+    visit_literal = generic_visit
+    visit_myself = generic_visit
+    visit_integer = generic_visit
+    visit_string = generic_visit
+    visit_unfinished_symbol = generic_visit
+    visit_complete_symbol = generic_visit
+    visit_code = generic_visit
+    visit_object = generic_visit
+    visit_slot = generic_visit
+    visit_none = generic_visit
+
+
+class _TreeBuilder(ArenaVisitor):
+    """Builds linked nodes from arena, every visit method gets already built children of its node"""
+    def build(self, tree, node_id):
+        """Builds node with all its descendants, walked with explicit stack as in ArenaCompiler.compile_expression"""
+        kinds, _, child_starts, children, _ = tree.get_columns()
+        visit_methods = self.get_visit_methods()
+
+        # built nodes whose parent was not built yet
+        built = []
+
+        # negative entries (complement of node id) mark nodes whose children were already pushed
+        stack = [node_id]
+
+        while stack:
+            node_id = stack.pop()
+
+            if node_id >= 0:
+                start = child_starts[node_id]
+                end = child_starts[node_id + 1]
+
+                # leaves are built right away
+                if start == end:
+                    built.append(visit_methods[kinds[node_id]](tree, node_id, []))
+                    continue
+
+                stack.append(~node_id)
+                stack.extend(reversed(children[start:end]))
+                continue
+
+            node_id = ~node_id
+
+            child_count = child_starts[node_id + 1] - child_starts[node_id]
+            node_children = built[len(built) - child_count:]
+            del built[len(built) - child_count:]
+
+            built.append(visit_methods[kinds[node_id]](tree, node_id, node_children))
+
+        return built[0]
+
+    def visit_send(self, tree, node_id, children):
+        receiver, selector, *parameters = children
+
+        return SendNode(receiver, selector, parameters)
+
+    def visit_explicit_return(self, tree, node_id, children):
+        return ExplicitReturnNode(children[0])
+
+    def visit_literal(self, tree, node_id, children):
+        return LiteralNode(children[0])
+
+    def visit_myself(self, tree, node_id, children):
+        return MyselfNode()
+
+    def visit_integer(self, tree, node_id, children):
+        return IntegerBox(tree.get_value(node_id))
+
+    def visit_string(self, tree, node_id, children):
+        return StringBox(tree.get_value(node_id))
+
+    def visit_unfinished_symbol(self, tree, node_id, children):
+        return UnfinishedSymbolBox(tree.get_value(node_id))
+
+    def visit_complete_symbol(self, tree, node_id, children):
+        arity, characters = tree.get_value(node_id)
+
+        return CompleteSymbolBox(arity, characters)
+
+    def visit_code(self, tree, node_id, children):
+        return CodeBox(children)
+
+    def visit_object(self, tree, node_id, children):
+        code, *slots = children
+
+        if tree.get_kind(tree.get_child(node_id, 0)) == NodeKinds.NONE:
+            code = None
+
+        return ObjectBox(slots, code)
+
+    def visit_slot(self, tree, node_id, children):
+        name, content = children
+        slot_kind_bits = tree.get_value(node_id)
+
+        slot_kind = []
+        if slot_kind_bits & SlotKindTags.PARENT_SLOT_TAG:
+            slot_kind.append("parent")
+        if slot_kind_bits & SlotKindTags.PARAMETER_SLOT_TAG:
+            slot_kind.append("parameter")
+
+        return (name, tuple(slot_kind), content)
+
+    def visit_none(self, tree, node_id, children):
+        return NoneBox()
+
+
+class ArenaCompiler(ArenaVisitor):
+    """
+    Compiles arena tree into same bytes as linked nodes would be compiled into.
+    Literal boxes are visited with writer they are written into
+    """
+    def write_code(self, tree, node_id, writer):
+        code_context = writer.create_code_context()
+
+        # empty code only has header and no instructions
+        expression_ids = tree.get_children(node_id)
+
+        if expression_ids:
+            for expression_id in expression_ids[:-1]:
+                self.compile_expression(tree, expression_id, code_context)
+                code_context.add_instruction(Opcodes.PULL, 0x00)
+
+            self.compile_expression(tree, expression_ids[-1], code_context)
+
+        code_context.finish()
+        writer.release_code_context(code_context)
+
+    def compile_expression(self, tree, node_id, code_context):
+        """
+        Compiles expression node. Expressions are walked with explicit stack over raw columns,
+        so deeply nested sends do not hit recursion limit
+        """
+        kinds, values, child_starts, children, constants = tree.get_columns()
+
+        add_instruction = code_context.add_instruction
+        add_literal_bytes = code_context.add_literal_bytes
+
+        # negative entries (complement of node id) mark nodes whose children were already compiled
+        stack = [node_id]
+
+        while stack:
+            node_id = stack.pop()
+
+            if node_id < 0:
+                node_id = ~node_id
+
+                if kinds[node_id] == _SEND_KIND:
+                    start = child_starts[node_id]
+                    arity = child_starts[node_id + 1] - start - 2
+                    selector_bytes = encode_symbol(arity, constants[values[children[start + 1]]])
+
+                    add_instruction(Opcodes.SEND, add_literal_bytes(selector_bytes))
+                else:
+                    add_instruction(Opcodes.RETURN_EXPLICIT, 0x00)
+
+                continue
+
+            kind = kinds[node_id]
+            start = child_starts[node_id]
+
+            if kind == _SEND_KIND:
+                stack.append(~node_id)
+
+                # receiver has to be compiled first, then parameters in order
+                stack.extend(reversed(children[start + 2:child_starts[node_id + 1]]))
+                stack.append(children[start])
+
+            elif kind == _LITERAL_KIND:
+                literal_id = children[start]
+                literal_kind = kinds[literal_id]
+
+                # most common literals are handled right here
+                if literal_kind == _INTEGER_KIND:
+                    add_instruction(Opcodes.PUSH_LITERAL, add_literal_bytes(encode_integer(constants[values[literal_id]])))
+                elif literal_kind == _STRING_KIND:
+                    add_instruction(Opcodes.PUSH_LITERAL, add_literal_bytes(encode_string(constants[values[literal_id]])))
+                else:
+                    self._compile_literal(tree, literal_id, code_context)
+
+            elif kind == _MYSELF_KIND:
+                add_instruction(Opcodes.PUSH_MYSELF, 0x00)
+
+            else:
+                stack.append(~node_id)
+                stack.append(children[start])
+
+    def _compile_literal(self, tree, literal_id, code_context):
+        literal_kind = tree.get_kind(literal_id)
+
+        if literal_kind == NodeKinds.OBJECT:
+            literal_index = code_context.add_written_literal(
+                lambda writer: self.visit_object(tree, literal_id, writer)
+            )
+        else:
+            literal_index = code_context.add_literal_bytes(self._get_literal_bytes(tree, literal_id, literal_kind))
+
+        code_context.add_instruction(Opcodes.PUSH_LITERAL, literal_index)
+
+    def visit_code(self, tree, node_id, writer):
+        self.write_code(tree, node_id, writer)
+
+    def visit_object(self, tree, node_id, writer):
+        code_id, *slot_ids = tree.get_children(node_id)
+
+        writer.write_byte(LiteralTags.VM_OBJECT)
+        writer.write_integer(len(slot_ids))
+
+        for slot_id in slot_ids:
+            tree.visit(slot_id, self, writer)
+
+        tree.visit(code_id, self, writer)
+
+    def visit_slot(self, tree, node_id, writer):
+        name_id, content_id = tree.get_children(node_id)
+
+        writer.write_byte(tree.get_value(node_id))
+
+        tree.visit(name_id, self, writer)
+        tree.visit(content_id, self, writer)
+
+    def visit_none(self, tree, node_id, writer):
+        writer.write_byte(LiteralTags.VM_NONE)
+
+    def _write_simple_literal(self, tree, node_id, writer):
+        writer.write_bytes(self._get_literal_bytes(tree, node_id, tree.get_kind(node_id)))
+
+    visit_integer = _write_simple_literal
+    visit_string = _write_simple_literal
+    visit_complete_symbol = _write_simple_literal
+
+    def _get_literal_bytes(self, tree, node_id, literal_kind):
+        value = tree.get_value(node_id)
+
+        if literal_kind == NodeKinds.INTEGER:
+            return encode_integer(value)
+        if literal_kind == NodeKinds.STRING:
+            return encode_string(value)
+        if literal_kind == NodeKinds.COMPLETE_SYMBOL:
+            return encode_symbol(*value)
+        if literal_kind == NodeKinds.NONE:
+            return bytes((LiteralTags.VM_NONE,))
+
+        # code literal is not interned, so its bytes are built separately
+        writer = BytecodeWriter()
+        self.write_code(tree, node_id, writer)
+
+        return writer.get_bytes()
@@ -1,86 +1,453 @@
-from bytecodes import LiteralTags, Opcodes
+import functools
+import operator
 import struct
 
-from source.compiler.bytecodes import SlotKindTags
+from source.compiler.bytecodes import LiteralTags, Opcodes, SlotKindTags, encode_instruction, stack_effect, \
+    measure_stack_depth, BytecodeVerificationError, iter_instructions
+
+
+# literals which have no identity of their own, so all their occurrences can share one literal pool entry
+# NOTE: objects and code are never interned, every object literal must stay distinct object
+_INTERNED_LITERAL_TAGS = frozenset((
+    LiteralTags.VM_NONE,
+    LiteralTags.VM_SMALL_INTEGER,
+    LiteralTags.VM_SYMBOL,
+    LiteralTags.VM_STRING,
+))
+
+
+# operators folded at compile time when both operands are integer literals.
+# division and remainder are left to VM, since their rounding is defined there
+_FOLDABLE_OPERATORS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+}
+
+_SMALL_INTEGER_MIN = -(1 << 63)
+_SMALL_INTEGER_MAX = (1 << 63) - 1
+
+
+def _fits_small_integer(value):
+    return _SMALL_INTEGER_MIN <= value <= _SMALL_INTEGER_MAX
 
 
 def translate_integer(value):
     return value.to_bytes(8, byteorder="big", signed=True)
 
+
+# placeholder for integers which are written before their value is known
+_RESERVED_INTEGER = bytes(8)
+
+
+# encoded literals are shared by whole process, since same selectors and constants appear in every code
+LITERAL_CACHE_SIZE = 4096
+
+# longer texts are encoded every time, so few huge strings cannot push out all common selectors
+_MAX_CACHED_TEXT_LENGTH = 256
+
+
+@functools.lru_cache(maxsize=LITERAL_CACHE_SIZE)
+def _encode_cached_symbol(arity, characters):
+    character_bytes = characters.encode("utf-8")
+
+    return b"".join((
+        bytes((LiteralTags.VM_SYMBOL,)),
+        translate_integer(arity),
+        translate_integer(len(character_bytes)),
+        character_bytes
+    ))
+
+@functools.lru_cache(maxsize=LITERAL_CACHE_SIZE)
+def _encode_cached_integer(value):
+    return bytes((LiteralTags.VM_SMALL_INTEGER,)) + translate_integer(value)
+
+@functools.lru_cache(maxsize=LITERAL_CACHE_SIZE)
+def _encode_cached_string(characters):
+    character_bytes = characters.encode("utf-8")
+
+    return bytes((LiteralTags.VM_STRING,)) + translate_integer(len(character_bytes)) + character_bytes
+
+_CACHED_ENCODERS = {
+    "symbol": _encode_cached_symbol,
+    "integer": _encode_cached_integer,
+    "string": _encode_cached_string,
+}
+
+
+def encode_symbol(arity, characters):
+    """Returns compiled form of symbol literal"""
+    if len(characters) > _MAX_CACHED_TEXT_LENGTH:
+        return _encode_cached_symbol.__wrapped__(arity, characters)
+
+    return _encode_cached_symbol(arity, characters)
+
+def encode_integer(value):
+    """Returns compiled form of small integer literal"""
+    return _encode_cached_integer(value)
+
+def encode_string(characters):
+    """Returns compiled form of string literal"""
+    if len(characters) > _MAX_CACHED_TEXT_LENGTH:
+        return _encode_cached_string.__wrapped__(characters)
+
+    return _encode_cached_string(characters)
+
+def translate_slot_kind(slot_kind):
+    """Translates slot kind (collection of kind names) into slot kind tag byte"""
+    slot_kind_bytes = 0x00000000
+
+    if "parent" in slot_kind:
+        slot_kind_bytes = slot_kind_bytes | SlotKindTags.PARENT_SLOT_TAG
+    if "parameter" in slot_kind:
+        slot_kind_bytes = slot_kind_bytes | SlotKindTags.PARAMETER_SLOT_TAG
+
+    return slot_kind_bytes
+
+
+def literal_cache_info():
+    """Returns statistics (functools cache info) of every literal encoding cache, by literal kind"""
+    return {kind: encoder.cache_info() for kind, encoder in _CACHED_ENCODERS.items()}
+
+def clear_literal_cache():
+    for encoder in _CACHED_ENCODERS.values():
+        encoder.cache_clear()
+
+
+class BytecodeWriter:
+    """
+    Growable byte buffer all nodes write their compiled form into.
+    Nested objects and code are written in place, values not known in advance (like lengths) are reserved
+    and back-patched once known.
+
+    Optimizer (see optimization.PeepholeOptimizer), if given, is run by every code context written into this writer.
+    Profiler (see profiling.CompileProfiler), if given, gets statistics of every finished code context
+    """
+    def __init__(self, optimizer=None, profiler=None):
+        self._buffer = bytearray()
+        self._optimizer = optimizer
+        self._profiler = profiler
+
+    def get_optimizer(self):
+        return self._optimizer
+
+    def get_profiler(self):
+        return self._profiler
+
+    def create_code_context(self):
+        """Returns code context writing into this writer"""
+        return CodeContext(self)
+
+    def release_code_context(self, code_context):
+        """Called with code context which was finished and is not used anymore"""
+        pass
+
+    def hold_literal_pool(self):
+        """Called when code context starts literal pool which optimizer may still cut literals out of"""
+        pass
+
+    def release_literal_pool(self):
+        """Called when literal pool held by hold_literal_pool is final"""
+        pass
+
+    def tell(self):
+        """Returns offset at which next byte will be written"""
+        return len(self._buffer)
+
+    def write_byte(self, value):
+        self._buffer.append(value)
+
+    def write_bytes(self, data):
+        self._buffer += data
+
+    def write_integer(self, value):
+        self._buffer += translate_integer(value)
+
+    def reserve_integer(self):
+        """Writes placeholder integer and returns its offset for later patch_integer call"""
+        offset = len(self._buffer)
+        self._buffer += _RESERVED_INTEGER
+
+        return offset
+
+    def patch_integer(self, offset, value):
+        self._buffer[offset:offset + 8] = translate_integer(value)
+
+    def remove_ranges(self, ranges):
+        """Removes sorted, non-overlapping (start, end) ranges, everything after them moves back"""
+        first_start = ranges[0][0]
+
+        kept_parts = []
+        position = first_start
+
+        for start, end in ranges:
+            kept_parts.append(self._buffer[position:start])
+            position = end
+
+        kept_parts.append(self._buffer[position:])
+
+        self._buffer[first_start:] = b"".join(kept_parts)
+
+    def get_bytes(self):
+        return bytes(self._buffer)
+
+
+class PooledBytecodeWriter(BytecodeWriter):
+    """
+    Writer meant to be reused for many small compilations. Released code contexts are kept
+    and reset for next code instead of allocating new ones
+    """
+    def __init__(self, optimizer=None, profiler=None):
+        super().__init__(optimizer, profiler)
+
+        self._free_code_contexts = []
+
+    def create_code_context(self):
+        if not self._free_code_contexts:
+            return CodeContext(self)
+
+        code_context = self._free_code_contexts.pop()
+        code_context.reset(self)
+
+        return code_context
+
+    def release_code_context(self, code_context):
+        self._free_code_contexts.append(code_context)
+
+    def reset(self, profiler=None):
+        """Empties writer for next compilation, profiler is replaced by given one"""
+        self._buffer.clear()
+        self._profiler = profiler
+
+
 class CodeContext:
     """
     Represents code object in bytecode form - with separate literals and bytecode
-    Used by nodes to compile themselves into it
+    Used by nodes to compile themselves into it.
+
+    Header and literals are written directly into writer as they come, bytecode is collected separately
+    and appended after literal pool when code is finished
     """
-    def __init__(self):
+    def __init__(self, writer=None):
+        self._bytecode = bytearray()
+
+        # writer offsets where literals start, so unused literals can be dropped by optimizer
+        self._literal_offsets = []
+
+        # arities of symbol literals by their index, SEND pops as many arguments as its selector has
+        self._selector_arities = {}
+
+        # maps encoded bytes of interned literal to its index in literal pool
+        self._literal_indices = {}
+
+        self.reset(writer)
+
+    def reset(self, writer=None):
+        """Starts new code in writer. Already allocated containers are kept, so context can be reused"""
+        if writer is None:
+            writer = BytecodeWriter()
+
+        self._writer = writer
+
+        # current and maximum depth of stack, maximum is stored in header
+        self._stack_depth = 0
         self._stack_usage = 0
-        self._literal_bytes = []
-        self._bytecode = []
+
+        self._literal_count = 0
+        self._deduplicated_count = 0
+
+        self._bytecode.clear()
+        self._literal_offsets.clear()
+        self._selector_arities.clear()
+        self._literal_indices.clear()
+
+        # stack usage and literal count are not known yet, so they are reserved and patched in finish
+        writer.write_byte(LiteralTags.VM_CODE)
+        self._stack_usage_offset = writer.reserve_integer()
+
+        writer.write_byte(LiteralTags.VM_OBJECT_ARRAY)
+        self._literal_count_offset = writer.reserve_integer()
+
+        if writer.get_optimizer() is not None:
+            writer.hold_literal_pool()
 
     def add_literal_bytes(self, literal_bytes):
-        index = len(self._literal_bytes)
-        self._literal_bytes.append(literal_bytes)
+        """Adds literal into literal pool and returns its index. Identical immutable literals share one index"""
+        is_interned = literal_bytes[0] in _INTERNED_LITERAL_TAGS
+
+        if is_interned:
+            literal_key = bytes(literal_bytes)
+            index = self._literal_indices.get(literal_key)
+
+            if index is not None:
+                self._deduplicated_count += 1
+                return index
+
+        index = self._literal_count
+        self._literal_count += 1
+        self._literal_offsets.append(self._writer.tell())
+        self._writer.write_bytes(literal_bytes)
+
+        if is_interned:
+            self._literal_indices[literal_key] = index
+
+        if literal_bytes[0] == LiteralTags.VM_SYMBOL:
+            self._selector_arities[index] = int.from_bytes(literal_bytes[1:9], byteorder="big", signed=True)
+
+        return index
+
+    def add_literal(self, literal_box):
+        """Adds literal box into literal pool and returns its index"""
+        if not isinstance(literal_box, ObjectBox):
+            return self.add_literal_bytes(literal_box.get_compiled())
+
+        return self.add_written_literal(literal_box.write_into)
+
+    def add_written_literal(self, write_function):
+        """
+        Adds literal which is never interned (object), written in place by write_function(writer).
+        Returns its index
+        """
+        index = self._literal_count
+        self._literal_count += 1
+        self._literal_offsets.append(self._writer.tell())
+        write_function(self._writer)
 
         return index
 
+    def get_deduplicated_count(self):
+        """Returns how many literals were not added to pool, because identical literal was already there"""
+        return self._deduplicated_count
+
     def add_instruction(self, opcode, opcode_parameter):
-        if opcode in (Opcodes.PUSH_MYSELF, Opcodes.PUSH_LITERAL):
-            self._stack_usage += 1
+        if opcode == Opcodes.SEND:
+            self._stack_depth -= self._selector_arities[opcode_parameter]
+        else:
+            self._stack_depth += stack_effect(opcode)
 
-        if not (0 <= opcode_parameter <= 255):
+        if self._stack_depth > self._stack_usage:
+            self._stack_usage = self._stack_depth
+
+        # common case - parameter fits into single byte
+        if 0 <= opcode_parameter <= 255:
+            self._bytecode.append(opcode)
+            self._bytecode.append(opcode_parameter)
+            return
+
+        if opcode_parameter < 0:
             raise SyntaxError()
 
-        self._bytecode.append(opcode)
-        self._bytecode.append(opcode_parameter)
+        # wide parameter needs EXTENDED_ARG prefixes
+        self._bytecode += encode_instruction(opcode, opcode_parameter)
 
-    def get_compiled(self):
-        code_bytes = [LiteralTags.VM_CODE]
+    def get_stack_usage(self):
+        """Returns maximum depth stack reaches while running this code"""
+        return self._stack_usage
 
-        # add stack usage
-        code_bytes.extend(
-            translate_integer(self._stack_usage)
-        )
+    def verify(self):
+        """Checks that stack never goes below zero and that tracked maximum depth is right"""
+        measured_usage = measure_stack_depth(self._bytecode, self._selector_arities)
 
-        # add literals
-        code_bytes.append(LiteralTags.VM_OBJECT_ARRAY)
-        code_bytes.extend(
-            translate_integer(len(self._literal_bytes))
-        )
-        for one_literal_bytes in self._literal_bytes:
-            code_bytes.extend(one_literal_bytes)
+        if measured_usage != self._stack_usage:
+            raise BytecodeVerificationError(
+                "Tracked stack usage {} does not match measured {}".format(self._stack_usage, measured_usage)
+            )
 
-        # add bytecode
-        code_bytes.append(LiteralTags.VM_BYTE_ARRAY)
-        code_bytes.extend(
-            translate_integer(len(self._bytecode))
+    def _optimize(self, optimizer):
+        """Runs optimizer over instructions and drops literals no instruction refers to anymore"""
+        instructions = optimizer.optimize(
+            [(opcode, parameter) for _, opcode, parameter in iter_instructions(self._bytecode)]
         )
-        code_bytes.extend(self._bytecode)
 
-        return code_bytes
+        used_literals = sorted({
+            parameter for opcode, parameter in instructions if opcode in (Opcodes.PUSH_LITERAL, Opcodes.SEND)
+        })
+
+        if len(used_literals) < self._literal_count:
+            optimizer.record_removed_literals(self._literal_count - len(used_literals))
+
+            self._remove_unused_literals(used_literals, instructions)
+
+        bytecode = bytearray()
+        for opcode, parameter in instructions:
+            bytecode += encode_instruction(opcode, parameter)
+
+        self._bytecode = bytecode
+        self._stack_usage = measure_stack_depth(bytecode, self._selector_arities)
+
+    def _remove_unused_literals(self, used_literals, instructions):
+        # literal pool is at the end of writer, so removed literals can be cut out of it
+        literal_ends = self._literal_offsets[1:] + [self._writer.tell()]
+        used_set = set(used_literals)
+
+        self._writer.remove_ranges([
+            (start, end)
+            for index, (start, end) in enumerate(zip(self._literal_offsets, literal_ends))
+            if index not in used_set
+        ])
+
+        new_indices = {old_index: new_index for new_index, old_index in enumerate(used_literals)}
+
+        instructions[:] = [
+            (opcode, new_indices[parameter] if opcode in (Opcodes.PUSH_LITERAL, Opcodes.SEND) else parameter)
+            for opcode, parameter in instructions
+        ]
+
+        self._selector_arities = {
+            new_indices[index]: arity for index, arity in self._selector_arities.items() if index in new_indices
+        }
+
+        self._literal_count = len(used_literals)
 
+        # offsets are not valid after compaction
+        self._literal_offsets.clear()
 
+    def finish(self):
+        """Patches header and writes bytecode after literals. Nothing can be added to context afterwards"""
+        writer = self._writer
 
+        optimizer = writer.get_optimizer()
+        if optimizer is not None:
+            self._optimize(optimizer)
+            writer.release_literal_pool()
 
+        writer.patch_integer(self._stack_usage_offset, self._stack_usage)
+        writer.patch_integer(self._literal_count_offset, self._literal_count)
 
+        writer.write_byte(LiteralTags.VM_BYTE_ARRAY)
+        writer.write_integer(len(self._bytecode))
+        writer.write_bytes(self._bytecode)
+
+        profiler = writer.get_profiler()
+        if profiler is not None:
+            profiler.record_code(self._literal_count, len(self._bytecode), self._stack_usage)
+
+    def get_compiled(self):
+        """Finishes context and returns content of its writer, meant for contexts which own their writer"""
+        self.finish()
+
+        return self._writer.get_bytes()
 
 
 class SendNode:
     """
     Represents message send tree node
     """
+    __slots__ = ("_receiver", "_selector", "_parameters")
+
     def __init__(self, receiver, selector, parameters):
         self._receiver = receiver
         self._selector = selector
         self._parameters = parameters
 
     def compile(self, code_context):
-        # compile receiver
-        self._receiver.compile(code_context)
+        # receiver, parameters and then send itself are compiled by _compile_expression without recursion
+        _compile_expression(self, code_context)
 
-        # compile parameters
-        for parameter in self._parameters:
-            parameter.compile(code_context)
+        return code_context
 
+    def _compile_send(self, code_context):
+        """Adds send instruction, receiver and parameters have to be compiled already"""
         # get arity
         arity = len(self._parameters)
 
@@ -94,35 +461,166 @@ class SendNode:
             selector_index
         )
 
-        return code_context
+    def fold_constants(self):
+        return _fold_expression(self)
+
+    def _fold_with(self, receiver, parameters):
+        """Returns folded send, given already folded receiver and parameters"""
+        folded_value = self._fold_operator(receiver, parameters)
+        if folded_value is not None:
+            return LiteralNode(IntegerBox(folded_value))
+
+        return SendNode(receiver, self._selector, parameters)
+
+    def get_receiver(self):
+        return self._receiver
+
+    def get_selector(self):
+        return self._selector
+
+    def get_parameters(self):
+        return self._parameters
+
+    def _fold_operator(self, receiver, parameters):
+        """Returns value of constant binary operator send, or None when it cannot be folded safely"""
+        operation = _FOLDABLE_OPERATORS.get(self._selector.get_value())
+
+        if operation is None or len(parameters) != 1:
+            return None
+
+        left = receiver.get_integer_value()
+        right = parameters[0].get_integer_value()
+
+        if left is None or right is None:
+            return None
+
+        # operand which does not fit into small integer literal is compile error without folding, it has to stay one
+        if not (_fits_small_integer(left) and _fits_small_integer(right)):
+            return None
+
+        result = operation(left, right)
+
+        # result would not fit into small integer literal, so it is up to VM to handle it
+        if not _fits_small_integer(result):
+            return None
+
+        return result
+
+    def get_integer_value(self):
+        return None
 
 class ExplicitReturnNode:
     """
     Represents explicit return from method
     """
+    __slots__ = ("_return_node",)
+
     def __init__(self, return_node):
         self._return_node = return_node
 
     def compile(self, code_context):
-        self._return_node.compile(code_context)
-
-        code_context.add_instruction(Opcodes.RETURN_EXPLICIT, 0x00)
+        _compile_expression(self, code_context)
 
         return code_context
 
+    def fold_constants(self):
+        return _fold_expression(self)
+
+    def get_return_node(self):
+        return self._return_node
+
+    def get_integer_value(self):
+        return None
+
+
+def _compile_expression(node, code_context):
+    """
+    Compiles expression node. Sends and explicit returns are walked with explicit stack (as in
+    ArenaCompiler.compile_expression), so long send chains and deeply nested arguments do not hit recursion limit
+    """
+    # nodes wrapped in tuple are sends and returns whose operands were already compiled
+    stack = [node]
+
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+
+        if node_type is tuple:
+            node, = node
+
+            if type(node) is SendNode:
+                node._compile_send(code_context)
+            else:
+                code_context.add_instruction(Opcodes.RETURN_EXPLICIT, 0x00)
+
+        elif node_type is SendNode:
+            stack.append((node,))
+
+            # receiver has to be compiled first, then parameters in order
+            stack.extend(reversed(node._parameters))
+            stack.append(node._receiver)
+
+        elif node_type is ExplicitReturnNode:
+            stack.append((node,))
+            stack.append(node._return_node)
+
+        else:
+            node.compile(code_context)
+
+
+def _fold_expression(node):
+    """Returns folded copy of expression node, walked with explicit stack same as in _compile_expression"""
+    # folded nodes whose parent was not folded yet
+    folded = []
+
+    stack = [node]
+
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+
+        if node_type is tuple:
+            node, = node
+
+            if type(node) is SendNode:
+                parameter_count = len(node._parameters)
+
+                parameters = folded[len(folded) - parameter_count:]
+                del folded[len(folded) - parameter_count:]
+
+                folded.append(node._fold_with(folded.pop(), parameters))
+            else:
+                folded.append(ExplicitReturnNode(folded.pop()))
+
+        elif node_type is SendNode:
+            stack.append((node,))
+
+            # receiver is folded first, then parameters in order
+            stack.extend(reversed(node._parameters))
+            stack.append(node._receiver)
+
+        elif node_type is ExplicitReturnNode:
+            stack.append((node,))
+            stack.append(node._return_node)
+
+        else:
+            folded.append(node.fold_constants())
+
+    return folded[0]
+
+
 class LiteralNode:
     """
     Represents literal that appears in code (and thus needs to be stored in list of literals)
     """
+    __slots__ = ("_literal_value",)
+
     def __init__(self, literal_value):
         self._literal_value = literal_value
 
     def compile(self, code_context):
-        # turns literal into bytes
-        literal_bytes = self._literal_value.get_compiled()
-
         # store literal and gets its index
-        literal_index = code_context.add_literal_bytes(literal_bytes)
+        literal_index = code_context.add_literal(self._literal_value)
 
         # store instruction
         code_context.add_instruction(
@@ -132,10 +630,34 @@ class LiteralNode:
 
         return code_context
 
+    def fold_constants(self):
+        return LiteralNode(self._literal_value.fold_constants())
+
+    def get_literal_value(self):
+        return self._literal_value
+
+    def get_integer_value(self):
+        """Returns value of integer literal, None for any other literal"""
+        if isinstance(self._literal_value, IntegerBox):
+            return self._literal_value.get_value()
+
+        return None
+
 class MyselfNode:
     """
-    Represents reference to currently running method activation. Used in message sending
+    Represents reference to currently running method activation. Used in message sending.
+    Node has no state, so there is only one shared instance of it
     """
+    __slots__ = ()
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+
+        return cls._instance
+
     def compile(self, code_context):
         # store instruction
         code_context.add_instruction(
@@ -145,7 +667,15 @@ class MyselfNode:
 
         return code_context
 
+    def fold_constants(self):
+        return self
+
+    def get_integer_value(self):
+        return None
+
 class SimpleValueBox:
+    __slots__ = ("_value",)
+
     def __init__(self, value):
         self._value = value
 
@@ -155,60 +685,83 @@ class SimpleValueBox:
             repr(self._value)
         )
 
-class IntegerBox(SimpleValueBox):
-    def get_compiled(self):
-        return [LiteralTags.VM_SMALL_INTEGER] + list( translate_integer(self._value) )
+    def write_into(self, writer):
+        writer.write_bytes(self.get_compiled())
 
+    def get_value(self):
+        return self._value
 
-class StringBox(SimpleValueBox):
-    def get_compiled(self):
-        my_bytes = [LiteralTags.VM_STRING]
+    def fold_constants(self):
+        return self
 
-        character_bytes = bytes(self._value.encode("utf-8"))
+class IntegerBox(SimpleValueBox):
+    __slots__ = ()
 
-        my_bytes.extend(translate_integer(len(self._value)))
+    def get_compiled(self):
+        return encode_integer(self._value)
 
-        my_bytes.extend(list(character_bytes))
 
-        return my_bytes
+class StringBox(SimpleValueBox):
+    __slots__ = ()
+
+    def get_compiled(self):
+        return encode_string(self._value)
 
 class UnfinishedSymbolBox(SimpleValueBox):
+    __slots__ = ()
+
     def get_compiled_with(self, symbol_arity):
-        return CompleteSymbolBox(symbol_arity, self._value).get_compiled()
+        return encode_symbol(symbol_arity, self._value)
 
 class CompleteSymbolBox:
+    __slots__ = ("_characters", "_arity")
+
     def __init__(self, arity, characters):
         self._characters = characters
         self._arity = arity
 
     def get_compiled(self):
-        symbol_bytes = [LiteralTags.VM_SYMBOL]
+        return encode_symbol(self._arity, self._characters)
 
-        symbol_bytes.extend(
-            translate_integer(self._arity)
-        )
-        symbol_bytes.extend(
-            translate_integer(len(self._characters))
-        )
-        symbol_bytes.extend(
-            (ord(character) for character in self._characters)
-        )
+    def write_into(self, writer):
+        writer.write_bytes(self.get_compiled())
+
+    def get_arity(self):
+        return self._arity
 
-        return symbol_bytes
+    def get_characters(self):
+        return self._characters
+
+    def fold_constants(self):
+        return self
 
 class CodeBox(SimpleValueBox):
-    def get_compiled(self):
-        new_code_context = CodeContext()
+    __slots__ = ()
+
+    def write_into(self, writer):
+        code_context = writer.create_code_context()
+
+        # empty code only has header and no instructions
+        if self._value:
+            *rest, tail = self._value
 
-        *rest, tail = self._value
+            for node in rest:
+                node.compile(code_context)
+                code_context.add_instruction(Opcodes.PULL, 0x00)
 
-        for node in rest:
-            node.compile(new_code_context)
-            new_code_context.add_instruction(Opcodes.PULL, 0x00)
+            tail.compile(code_context)
 
-        tail.compile(new_code_context)
+        code_context.finish()
+        writer.release_code_context(code_context)
 
-        return new_code_context
+    def fold_constants(self):
+        return CodeBox([node.fold_constants() for node in self._value])
+
+    def get_compiled(self, optimizer=None):
+        writer = BytecodeWriter(optimizer)
+        self.write_into(writer)
+
+        return writer.get_bytes()
 
 
 
@@ -217,48 +770,67 @@ class ObjectBox:
     """
     Box storing object. Because its complexity, it cannot be handed by simple value box
     """
+    __slots__ = ("_slots", "_code")
+
     def __init__(self, slots, code):
         self._slots = slots
         self._code = code
 
-    def get_compiled(self):
-        object_bytes = [LiteralTags.VM_OBJECT]
+    def write_into(self, writer):
+        writer.write_byte(LiteralTags.VM_OBJECT)
 
         # handle slots
-        object_bytes.extend(
-            translate_integer(self._slots)
-        )
+        writer.write_integer(len(self._slots))
 
         for slot in self._slots:
             slot_name, slot_kind, slot_content = slot
 
-            slot_kind_bytes = 0x00000000
-
-            if "parent" in slot_kind:
-                slot_kind_bytes = slot_kind_bytes | SlotKindTags.PARENT_SLOT_TAG
-            if "parameter" in slot_kind:
-                slot_kind_bytes = slot_kind_bytes | SlotKindTags.PARAMETER_SLOT_TAG
-
-            object_bytes.append(slot_kind)
+            writer.write_byte(translate_slot_kind(slot_kind))
 
-            object_bytes.extend(
-                slot_name.get_compiled()
-            )
-
-            object_bytes.extend(
-                slot_content.get_compiled()
-            )
+            slot_name.write_into(writer)
+            slot_content.write_into(writer)
 
         # handle code
         if self._code is None:
-            object_bytes.append(LiteralTags.VM_NONE)
+            writer.write_byte(LiteralTags.VM_NONE)
         else:
-            object_bytes.extend(
-                self._code.get_compiled()
-            )
+            self._code.write_into(writer)
+
+    def fold_constants(self):
+        return ObjectBox(
+            [(slot_name, slot_kind, slot_content.fold_constants()) for slot_name, slot_kind, slot_content in self._slots],
+            None if self._code is None else self._code.fold_constants()
+        )
+
+    def get_slots(self):
+        return self._slots
+
+    def get_code(self):
+        return self._code
+
+    def get_compiled(self):
+        writer = BytecodeWriter()
+        self.write_into(writer)
 
-        return object_bytes
+        return writer.get_bytes()
 
 class NoneBox:
+    """Box of missing value. Box has no state, so there is only one shared instance of it"""
+    __slots__ = ()
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+
+        return cls._instance
+
     def get_compiled(self):
-        return [LiteralTags.VM_NONE]
\ No newline at end of file
+        return bytes((LiteralTags.VM_NONE,))
+
+    def write_into(self, writer):
+        writer.write_byte(LiteralTags.VM_NONE)
+
+    def fold_constants(self):
+        return self
@@ -1,11 +1,24 @@
 
+class BytecodeVerificationError(Exception):
+    pass
+
+
 CORRECT_MODULE_SIGNATURE = [ord(char) for char in "ORE"]
 
+# version of module header layout, written right after signature
+MODULE_FORMAT_VERSION = 1
+
+# identifies compiler output, has to be changed whenever same source would be compiled into different bytes
+COMPILER_VERSION_TAG = "ore-{}.1".format(MODULE_FORMAT_VERSION)
+
 class Opcodes:
 
     # empty opcode, does nothing
     NOOP = 0x00
 
+    # prefix providing higher 8 bits of following instruction parameter, can be chained for even wider parameters
+    EXTENDED_ARG = 0x01
+
     # push running method into active frame stack
     PUSH_MYSELF = 0x10
 
@@ -42,3 +55,91 @@ class SlotKindTags:
     PARENT_SLOT_TAG =  0b00000001
 
     PARAMETER_SLOT_TAG = 0b00000010
+
+
+def encode_instruction(opcode, parameter):
+    """Encodes instruction, parameters above 255 get EXTENDED_ARG prefixes with their higher bytes"""
+    if parameter < 0:
+        raise ValueError("Instruction parameter must not be negative")
+
+    encoded = bytearray((opcode, parameter & 0xFF))
+    parameter >>= 8
+
+    while parameter:
+        encoded[0:0] = (Opcodes.EXTENDED_ARG, parameter & 0xFF)
+        parameter >>= 8
+
+    return bytes(encoded)
+
+
+def iter_instructions(bytecode):
+    """
+    Yields (offset, opcode, parameter) of every instruction in bytecode, with EXTENDED_ARG prefixes folded
+    into parameter of instruction they belong to. Offset is that of first prefix
+    """
+    extended_parameter = 0
+    start = None
+
+    for offset in range(0, len(bytecode) - 1, 2):
+        opcode = bytecode[offset]
+        parameter = extended_parameter | bytecode[offset + 1]
+
+        if start is None:
+            start = offset
+
+        if opcode == Opcodes.EXTENDED_ARG:
+            extended_parameter = parameter << 8
+            continue
+
+        yield start, opcode, parameter
+
+        extended_parameter = 0
+        start = None
+
+    if start is not None or len(bytecode) % 2:
+        raise ValueError("Bytecode ends in middle of instruction")
+
+
+def stack_effect(opcode, selector_arity=0):
+    """
+    Returns how instruction changes depth of active frame stack.
+    SEND pops receiver with all its arguments and pushes result, so it needs arity of its selector
+    """
+    if opcode in (Opcodes.PUSH_MYSELF, Opcodes.PUSH_LITERAL):
+        return 1
+
+    if opcode in (Opcodes.PULL, Opcodes.RETURN_EXPLICIT):
+        return -1
+
+    if opcode == Opcodes.SEND:
+        return -selector_arity
+
+    # NOOP and EXTENDED_ARG
+    return 0
+
+
+def measure_stack_depth(bytecode, selector_arities):
+    """
+    Returns maximum stack depth bytecode reaches, selector_arities maps literal index of SEND selector to its arity.
+    Raises BytecodeVerificationError if depth would ever go below zero
+    """
+    depth = max_depth = 0
+
+    for offset, opcode, parameter in iter_instructions(bytecode):
+        arity = selector_arities[parameter] if opcode == Opcodes.SEND else 0
+
+        # send needs its receiver and arguments on stack
+        if depth < arity + 1 and opcode == Opcodes.SEND:
+            raise BytecodeVerificationError(
+                "Send at {} needs {} stack items, but only {} are there".format(offset, arity + 1, depth)
+            )
+
+        depth += stack_effect(opcode, arity)
+
+        if depth < 0:
+            raise BytecodeVerificationError("Stack depth goes below zero at {}".format(offset))
+
+        if depth > max_depth:
+            max_depth = depth
+
+    return max_depth
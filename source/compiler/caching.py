@@ -0,0 +1,164 @@
+import hashlib
+import os
+import tempfile
+
+from source.compiler.bytecodes import COMPILER_VERSION_TAG
+from source.compiler.compilation import compile_source
+from source.compiler.parsing import Parser
+
+
+DEFAULT_MAX_SIZE_BYTES = 64 * 1024 * 1024
+
+_ENTRY_SUFFIX = ".ore"
+
+
+class CompilationCache:
+    """
+    On-disk cache of compiled modules. Entry is keyed by hash of source text, compilation options
+    and compiler version tag, so changed compiler never returns stale output.
+
+    Least recently used entries (by modification time, which is refreshed on every hit) are evicted
+    once total size of entries goes over max_size_bytes
+    """
+    def __init__(self, directory, max_size_bytes=DEFAULT_MAX_SIZE_BYTES):
+        self._directory = directory
+        self._max_size_bytes = max_size_bytes
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._total_size = sum(size for _, _, size in self._list_entries())
+
+    def get_key(self, source_code, optimize=False, fold_constants=False):
+        key_hash = hashlib.sha256()
+
+        key_hash.update(COMPILER_VERSION_TAG.encode("ascii"))
+        key_hash.update(bytes((optimize, fold_constants)))
+        key_hash.update(source_code.encode("utf-8"))
+
+        return key_hash.hexdigest()
+
+    def lookup(self, key):
+        """Returns cached module bytes, or None if there is no entry for key"""
+        entry_path = self._get_entry_path(key)
+
+        try:
+            with open(entry_path, "rb") as entry_file:
+                module_bytes = entry_file.read()
+
+            # mark entry as recently used
+            os.utime(entry_path)
+        except FileNotFoundError:
+            self._misses += 1
+            return None
+
+        self._hits += 1
+        return module_bytes
+
+    def store(self, key, module_bytes):
+        entry_path = self._get_entry_path(key)
+
+        try:
+            previous_size = os.path.getsize(entry_path)
+        except FileNotFoundError:
+            previous_size = 0
+
+        # write into temporary file first, so other processes never see partially written entry
+        descriptor, temporary_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as temporary_file:
+                temporary_file.write(module_bytes)
+
+            os.replace(temporary_path, entry_path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+        self._total_size += len(module_bytes) - previous_size
+
+        if self._total_size > self._max_size_bytes:
+            self._evict()
+
+    def compile(self, source_code, optimize=False, fold_constants=False, profiler=None, parser_class=Parser):
+        """
+        Returns module bytes of source, compiling and storing them only when they are not cached yet.
+        Profiler only gets statistics of compilation, when there is any.
+        Parser class is not part of key, all parsers build the same trees
+        """
+        key = self.get_key(source_code, optimize, fold_constants)
+
+        module_bytes = self.lookup(key)
+
+        if profiler is not None:
+            profiler.record_cache_hit(module_bytes is not None)
+
+            if module_bytes is not None:
+                profiler.record_module(len(source_code), len(module_bytes))
+
+        if module_bytes is None:
+            module_bytes = compile_source(source_code, optimize, fold_constants, profiler, parser_class)
+            self.store(key, module_bytes)
+
+        return module_bytes
+
+    def clear(self):
+        for entry_path, _, _ in self._list_entries():
+            self._remove_entry(entry_path)
+
+        self._total_size = 0
+
+    def get_statistics(self):
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "size_bytes": self._total_size,
+        }
+
+    def _get_entry_path(self, key):
+        return os.path.join(self._directory, key + _ENTRY_SUFFIX)
+
+    def _list_entries(self):
+        """Returns (path, modification time, size) of every entry"""
+        entries = []
+
+        with os.scandir(self._directory) as directory_entries:
+            for directory_entry in directory_entries:
+                if not directory_entry.name.endswith(_ENTRY_SUFFIX):
+                    continue
+
+                try:
+                    entry_stat = directory_entry.stat()
+                except FileNotFoundError:
+                    continue
+
+                entries.append((directory_entry.path, entry_stat.st_mtime_ns, entry_stat.st_size))
+
+        return entries
+
+    def _evict(self):
+        entries = self._list_entries()
+        entries.sort(key=lambda entry: entry[1])
+
+        # directory may be shared with other processes, so size is recounted from what is really there
+        self._total_size = sum(size for _, _, size in entries)
+
+        for entry_path, _, entry_size in entries:
+            if self._total_size <= self._max_size_bytes:
+                break
+
+            if self._remove_entry(entry_path):
+                self._evictions += 1
+
+            self._total_size -= entry_size
+
+    def _remove_entry(self, entry_path):
+        try:
+            os.unlink(entry_path)
+        except FileNotFoundError:
+            return False
+
+        return True
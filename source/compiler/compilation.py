@@ -0,0 +1,116 @@
+import collections
+import contextlib
+
+from source.compiler.ast_nodes import PooledBytecodeWriter
+from source.compiler.tokenization import Tokenizer, TokenizerEngines, TokenizerError, map_source_file
+from source.compiler.parsing import Parser, ParserError
+from source.compiler.optimization import PeepholeOptimizer, fold_constants as fold_tree_constants
+from source.compiler.serialization import write_module_header
+
+
+# errors which mean that source itself cannot be compiled
+COMPILATION_ERRORS = (TokenizerError, ParserError, SyntaxError, OverflowError, RecursionError, UnicodeDecodeError)
+
+
+# sources up to this length are tokenized into plain list, longer ones into compact TokenBuffer
+SMALL_SOURCE_LENGTH = 4096
+
+# result of one source of batch, exactly one of module bytes and error is set
+BatchResult = collections.namedtuple("BatchResult", ("module_bytes", "error"))
+
+
+def _skip_stage(stage_name):
+    return contextlib.nullcontext()
+
+
+class BatchCompiler:
+    """
+    Compiles many sources one after another. Tokenizer, writer and code contexts are created once
+    and reused by every compilation, literal encodings come from process-wide cache.
+    Compiler is not meant to be shared between threads.
+
+    Tokens of small sources are kept as plain list, which is faster to parse than TokenBuffer,
+    but takes much more memory for big ones.
+
+    Parser class can be IterativeParser for deeply nested (e.g. generated) sources, which recursive Parser
+    cannot parse. Both build the same trees
+    """
+    def __init__(self, optimize=False, fold_constants=False, parser_class=Parser):
+        self._fold_constants = fold_constants
+        self._parser_class = parser_class
+
+        # whitespace runs become single tokens, parser only ever jumps over them
+        self._tokenizer = Tokenizer(TokenizerEngines.REGEX, collapse_whitespace=True)
+
+        self._writer = PooledBytecodeWriter(PeepholeOptimizer() if optimize else None)
+
+    def compile(self, source_code, profiler=None):
+        """
+        Compiles source text into module bytes (signature, header and root code).
+        Source can also be UTF-8 encoded bytes-like object (see Tokenizer.tokenize_to_buffer).
+        Profiler (profiling.CompileProfiler), if given, collects timings and statistics of every stage
+        """
+        measure_stage = _skip_stage if profiler is None else profiler.measure_stage
+
+        with measure_stage("tokenize"):
+            if isinstance(source_code, str) and len(source_code) <= SMALL_SOURCE_LENGTH:
+                tokens = self._tokenizer.tokenize(source_code)
+            else:
+                tokens = self._tokenizer.tokenize_to_buffer(source_code)
+
+        with measure_stage("parse"):
+            root_code = self._parser_class(
+                tokens,
+                collapsed_whitespace=True,
+                line_index=self._tokenizer.get_line_index
+            ).parse_root_code()
+
+        if self._fold_constants:
+            with measure_stage("fold_constants"):
+                root_code = fold_tree_constants(root_code)
+
+        with measure_stage("emit"):
+            writer = self._writer
+            writer.reset(profiler)
+
+            write_module_header(writer)
+            root_code.write_into(writer)
+
+            module_bytes = writer.get_bytes()
+
+        if profiler is not None:
+            profiler.record_tokens(tokens)
+            profiler.record_tree(root_code)
+            profiler.record_module(len(source_code), len(module_bytes))
+
+        return module_bytes
+
+    def compile_all(self, sources):
+        """Yields BatchResult for every source in order, error in one source does not affect others"""
+        for source_code in sources:
+            try:
+                module_bytes = self.compile(source_code)
+            except COMPILATION_ERRORS as error:
+                yield BatchResult(None, error)
+                continue
+
+            yield BatchResult(module_bytes, None)
+
+
+def compile_source(source_code, optimize=False, fold_constants=False, profiler=None, parser_class=Parser):
+    """
+    Compiles single source text into module bytes.
+    Optimize runs peephole optimizer over every code, fold_constants folds constant integer operator sends
+    """
+    return BatchCompiler(optimize, fold_constants, parser_class).compile(source_code, profiler)
+
+
+def compile_mapped_file(source_path, optimize=False, fold_constants=False, profiler=None, parser_class=Parser):
+    """Compiles source file, which is memory-mapped and scanned as bytes instead of being read and decoded as whole"""
+    with map_source_file(source_path) as source:
+        return BatchCompiler(optimize, fold_constants, parser_class).compile(source, profiler)
+
+
+def compile_batch(sources, optimize=False, fold_constants=False, parser_class=Parser):
+    """Compiles all sources with one shared compiler, returns list of BatchResult"""
+    return list(BatchCompiler(optimize, fold_constants, parser_class).compile_all(sources))
@@ -0,0 +1,200 @@
+import argparse
+import collections
+import concurrent.futures
+import functools
+import json
+import os
+import sys
+
+from source.compiler.caching import CompilationCache
+from source.compiler.compilation import compile_source, compile_mapped_file, COMPILATION_ERRORS
+from source.compiler.parsing import Parser, PARSER_CLASSES
+from source.compiler.profiling import CompileProfiler
+
+
+DEFAULT_SOURCE_SUFFIX = ".src"
+OUTPUT_SUFFIX = ".ore"
+
+# errors which mean that one source could not be compiled, anything else is a bug and stops whole build
+_COMPILATION_ERRORS = COMPILATION_ERRORS + (OSError,)
+
+# sources bigger than this are memory-mapped instead of being read into memory (unless they go through cache)
+MAPPED_SOURCE_SIZE = 1024 * 1024
+
+
+# profile is dictionary of profiler statistics (see CompileProfiler.to_dict), when profiling was requested
+CompilationResult = collections.namedtuple(
+    "CompilationResult",
+    ("source_path", "module_bytes", "error", "profile"),
+    defaults=(None,)
+)
+
+
+# cache of worker process, created by _initialize_worker
+_worker_cache = None
+
+
+def _initialize_worker(cache_directory):
+    global _worker_cache
+
+    # called with None after single-worker build, so cache never leaks into next build in the same process
+    _worker_cache = None if cache_directory is None else CompilationCache(cache_directory)
+
+
+def compile_file(source_path, optimize=False, fold_constants=False, profile=False, parser_class=Parser):
+    """Compiles one source file. Errors are returned in result instead of being raised"""
+    profiler = CompileProfiler(source_path) if profile else None
+
+    try:
+        if _worker_cache is None and os.path.getsize(source_path) > MAPPED_SOURCE_SIZE:
+            module_bytes = compile_mapped_file(source_path, optimize, fold_constants, profiler, parser_class)
+        else:
+            with open(source_path, "r", encoding="utf-8", newline="") as source_file:
+                source_code = source_file.read()
+
+            if _worker_cache is None:
+                module_bytes = compile_source(source_code, optimize, fold_constants, profiler, parser_class)
+            else:
+                module_bytes = _worker_cache.compile(source_code, optimize, fold_constants, profiler, parser_class)
+    except _COMPILATION_ERRORS as error:
+        return CompilationResult(source_path, None, "{}: {}".format(type(error).__name__, error))
+
+    return CompilationResult(source_path, module_bytes, None, profiler and profiler.to_dict())
+
+
+def find_sources(source_directory, suffix=DEFAULT_SOURCE_SUFFIX):
+    """Returns sorted paths of all sources under directory"""
+    source_paths = []
+
+    for directory_path, directory_names, file_names in os.walk(source_directory):
+        directory_names.sort()
+
+        for file_name in file_names:
+            if file_name.endswith(suffix):
+                source_paths.append(os.path.join(directory_path, file_name))
+
+    source_paths.sort()
+
+    return source_paths
+
+
+def compile_files(source_paths, workers=None, optimize=False, fold_constants=False, cache_directory=None,
+                  profile=False, parser_class=Parser):
+    """
+    Compiles sources across process pool. Results are returned in same order as paths were given,
+    so output does not depend on which worker finished first.
+    With single worker, everything is compiled in current process
+    """
+    worker = functools.partial(
+        compile_file,
+        optimize=optimize,
+        fold_constants=fold_constants,
+        profile=profile,
+        parser_class=parser_class
+    )
+
+    if workers == 1:
+        _initialize_worker(cache_directory)
+        try:
+            return [worker(source_path) for source_path in source_paths]
+        finally:
+            _initialize_worker(None)
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_initialize_worker,
+        initargs=(cache_directory,)
+    ) as executor:
+        # sources are handed out in batches, so inter-process overhead is paid per batch instead of per file
+        worker_count = workers or os.cpu_count() or 1
+        chunk_size = max(1, len(source_paths) // (worker_count * 4))
+
+        return list(executor.map(worker, source_paths, chunksize=chunk_size))
+
+
+def get_output_path(source_path, source_directory, output_directory, suffix=DEFAULT_SOURCE_SUFFIX):
+    """Maps source path onto path of its module, keeping directory structure"""
+    relative_path = os.path.relpath(source_path, source_directory)
+
+    return os.path.join(output_directory, relative_path[:-len(suffix)] + OUTPUT_SUFFIX)
+
+
+def compile_tree(source_directory, output_directory, suffix=DEFAULT_SOURCE_SUFFIX, workers=None,
+                 optimize=False, fold_constants=False, cache_directory=None, profile=False, parser_class=Parser):
+    """Compiles every source under source directory into module under output directory. Returns results"""
+    results = compile_files(
+        find_sources(source_directory, suffix),
+        workers=workers,
+        optimize=optimize,
+        fold_constants=fold_constants,
+        cache_directory=cache_directory,
+        profile=profile,
+        parser_class=parser_class
+    )
+
+    for result in results:
+        if result.error is not None:
+            continue
+
+        output_path = get_output_path(result.source_path, source_directory, output_directory, suffix)
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+        with open(output_path, "wb") as output_file:
+            output_file.write(result.module_bytes)
+
+    return results
+
+
+def main(arguments=None):
+    argument_parser = argparse.ArgumentParser(description="Compiles directory tree of sources into ORE modules")
+
+    argument_parser.add_argument("source_directory")
+    argument_parser.add_argument("output_directory")
+    argument_parser.add_argument("--suffix", default=DEFAULT_SOURCE_SUFFIX, help="suffix of source files")
+    argument_parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    argument_parser.add_argument("--optimize", action="store_true", help="run peephole optimizer")
+    argument_parser.add_argument("--fold-constants", action="store_true", help="fold constant integer operators")
+    argument_parser.add_argument("--cache", default=None, help="directory of compilation cache")
+    argument_parser.add_argument("--profile", default=None, help="write compile statistics as JSON lines into file")
+    argument_parser.add_argument(
+        "--parser",
+        choices=sorted(PARSER_CLASSES),
+        default="recursive",
+        help="iterative parser also handles deeply nested sources, recursive one is a bit faster"
+    )
+
+    options = argument_parser.parse_args(arguments)
+
+    results = compile_tree(
+        options.source_directory,
+        options.output_directory,
+        suffix=options.suffix,
+        workers=options.workers,
+        optimize=options.optimize,
+        fold_constants=options.fold_constants,
+        cache_directory=options.cache,
+        profile=options.profile is not None,
+        parser_class=PARSER_CLASSES[options.parser]
+    )
+
+    if options.profile is not None:
+        with open(options.profile, "w") as profile_file:
+            for result in results:
+                if result.profile is not None:
+                    profile_file.write(json.dumps(result.profile, sort_keys=True) + "\n")
+
+    failed_count = 0
+
+    for result in results:
+        if result.error is not None:
+            failed_count += 1
+            print("{}: {}".format(result.source_path, result.error), file=sys.stderr)
+
+    print("compiled {} of {} sources".format(len(results) - failed_count, len(results)))
+
+    return 1 if failed_count else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
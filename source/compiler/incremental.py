@@ -0,0 +1,270 @@
+import bisect
+import itertools
+
+from source.compiler.ast_nodes import CodeBox
+from source.compiler.compilation import COMPILATION_ERRORS
+from source.compiler.optimization import PeepholeOptimizer
+from source.compiler.parsing import Parser
+from source.compiler.serialization import get_module_bytes
+from source.compiler.tokenization import Tokenizer, TokenizerEngines, TokenizerError, TokenCursor, TokenTypes
+
+
+def _shift_position(position, start_position):
+    """Turns (line, column) inside text into (line, column) of document where that text starts at start position"""
+    line, column = position
+    start_line, start_column = start_position
+
+    if line == 0:
+        column += start_column
+
+    return start_line + line, column
+
+
+class _ShiftedLineIndex:
+    """Line index of part of document, reports positions in whole document"""
+    def __init__(self, line_index, start_position):
+        self._line_index = line_index
+        self._start_position = start_position
+
+    def position_of(self, offset):
+        return _shift_position(self._line_index.position_of(offset), self._start_position)
+
+
+class _Segment:
+    """
+    One top-level expression of document together with whitespace before it and its terminating comma.
+    Token offsets are relative to start of segment, so segments after edited place stay untouched.
+    Broken segment (rest of document which cannot be parsed) has neither tokens nor node
+    """
+    __slots__ = ("text", "tokens", "node")
+
+    def __init__(self, text, tokens, node):
+        self.text = text
+        self.tokens = tokens
+        self.node = node
+
+
+class IncrementalDocument:
+    """
+    Source kept split into top-level expressions of root code. Edit re-tokenizes and re-parses
+    only segments it touches, nodes of all other segments are reused as they are.
+
+    Segment boundaries lie right after top-level commas and tokenizer does not look behind,
+    so text of touched segments can be scanned and parsed on its own. If it does not parse (e.g. edit removed comma
+    or opened string), following segments are added to it until it does. When it cannot be parsed even with rest
+    of document, that rest is kept as one broken segment and its error is reported by get_error
+    """
+    def __init__(self, source_code=""):
+        self._tokenizer = Tokenizer(TokenizerEngines.REGEX, collapse_whitespace=True)
+
+        self._segments = []
+
+        # source offset where every segment ends, kept for finding segments by offset.
+        # Edit moves all following segments, so instead of updating their ends right away, shift is remembered
+        # and ends from shift start on are only stored without it. Next edit near the same place then does not
+        # have to touch them at all
+        self._ends = []
+        self._shift_start = 0
+        self._shift = 0
+
+        # error of broken segment, found when first requested after edit
+        self._error = None
+
+        self.edit(0, 0, source_code)
+
+    def __len__(self):
+        return self._get_end(len(self._ends) - 1)
+
+    def get_text(self):
+        return "".join(segment.text for segment in self._segments)
+
+    def get_segment_count(self):
+        return len(self._segments)
+
+    def _is_broken(self):
+        return bool(self._segments) and self._segments[-1].node is None
+
+    def _get_end(self, index):
+        """Returns source offset where segment ends, 0 for index -1 (before first segment)"""
+        if index < 0:
+            return 0
+
+        return self._ends[index] + (self._shift if index >= self._shift_start else 0)
+
+    def _find_segment(self, offset):
+        """Returns index of segment containing offset, number of segments for offset at end of document"""
+        ends = self._ends
+        shift_start = self._shift_start
+
+        if shift_start and offset < ends[shift_start - 1]:
+            return bisect.bisect_right(ends, offset, 0, shift_start)
+
+        return bisect.bisect_right(ends, offset - self._shift, shift_start)
+
+    def _move_shift_start(self, index):
+        """Moves start of pending shift, ends between old and new start are updated"""
+        ends = self._ends
+
+        for position in range(self._shift_start, index):
+            ends[position] += self._shift
+
+        for position in range(index, self._shift_start):
+            ends[position] -= self._shift
+
+        self._shift_start = index
+
+    def edit(self, offset, removed_length, inserted_text):
+        """Replaces removed length of characters at offset with inserted text"""
+        if offset < 0 or removed_length < 0 or offset + removed_length > len(self):
+            raise ValueError("Edit of {} characters at {} is out of document".format(removed_length, offset))
+
+        segments = self._segments
+
+        # touched segments are those containing removed characters or insertion point
+        first = self._find_segment(offset)
+
+        # text appended to broken segment may be what it was missing
+        if first == len(segments) and self._is_broken():
+            first -= 1
+
+        if removed_length:
+            stop = self._find_segment(offset + removed_length - 1) + 1
+        else:
+            stop = min(first + 1, len(segments))
+
+        region_start = self._get_end(first - 1)
+        region_text = "".join(segment.text for segment in segments[first:stop])
+
+        edit_start = offset - region_start
+        region_text = region_text[:edit_start] + inserted_text + region_text[edit_start + removed_length:]
+
+        # when touched text does not parse, it is extended by following segments, taking twice as many every time
+        extension = 1
+
+        while True:
+            try:
+                new_segments = self._parse_segments(region_text)
+                break
+            except COMPILATION_ERRORS:
+                if stop == len(segments):
+                    new_segments = [_Segment(region_text, None, None)]
+                    break
+
+                region_text += "".join(segment.text for segment in segments[stop:stop + extension])
+                stop = min(stop + extension, len(segments))
+                extension *= 2
+
+        old_region_end = self._get_end(stop - 1) if stop > first else region_start
+
+        # segments after touched ones keep their (shifted) ends, pending shift is moved next to them
+        if self._shift_start < first:
+            self._move_shift_start(first)
+        elif self._shift_start > stop:
+            self._move_shift_start(stop)
+
+        new_ends = itertools.accumulate((len(segment.text) for segment in new_segments), initial=region_start)
+        next(new_ends)
+
+        segments[first:stop] = new_segments
+        self._ends[first:stop] = new_ends
+
+        self._shift_start = first + len(new_segments)
+        self._shift += region_start + len(region_text) - old_region_end
+
+        self._error = None
+
+    def _parse_segments(self, text, start_position=None):
+        """
+        Splits text into parsed segments, raises error of tokenizer or parser if it is not whole expressions.
+        Parser errors are reported as lines and columns of document only when start position of text is given
+        """
+        tokens = self._tokenizer.tokenize(text)
+        cursor = TokenCursor(tokens)
+
+        line_index = None
+        if start_position is not None:
+            line_index = _ShiftedLineIndex(self._tokenizer.get_line_index(), start_position)
+
+        parser = Parser(cursor, collapsed_whitespace=True, line_index=line_index)
+
+        segments = []
+        start_index = 0
+
+        for node in parser.iter_root_expressions():
+            end_index = cursor.get_index()
+
+            start = tokens[start_index][1]
+            end = tokens[end_index][1]
+
+            segment_tokens = [
+                (token_type, token_offset - start, token_value)
+                for token_type, token_offset, token_value in tokens[start_index:end_index]
+            ]
+
+            segments.append(_Segment(text[start:end], segment_tokens, node))
+            start_index = end_index
+
+        return segments
+
+    def get_error(self):
+        """Returns error which prevents document from being parsed, None if there is no such error"""
+        if not self._is_broken():
+            return None
+
+        if self._error is None:
+            self._error = self._find_error()
+
+        return self._error
+
+    def _find_error(self):
+        """Parses broken segment again, this time with error positions counted in whole document"""
+        preceding_text = "".join(segment.text for segment in self._segments[:-1])
+        start_position = (preceding_text.count("\n"), len(preceding_text) - preceding_text.rfind("\n") - 1)
+
+        try:
+            self._parse_segments(self._segments[-1].text, start_position)
+        except TokenizerError as error:
+            position, message = error.args
+
+            return TokenizerError(_shift_position(position, start_position), message)
+        except COMPILATION_ERRORS as error:
+            return error
+
+        raise AssertionError("Broken segment was parsed")
+
+    def get_tokens(self):
+        """Returns tokens of whole document (as Tokenizer with collapsed whitespace would), last token is EOF"""
+        error = self.get_error()
+        if error is not None:
+            raise error
+
+        tokens = []
+
+        for index, segment in enumerate(self._segments):
+            start = self._get_end(index - 1)
+
+            tokens.extend(
+                (token_type, start + token_offset, token_value)
+                for token_type, token_offset, token_value in segment.tokens
+            )
+
+        tokens.append((TokenTypes.EOF, len(self), ""))
+
+        return tokens
+
+    def get_root_code(self):
+        """Returns root code made of nodes of all segments, same as Parser.parse_root_code of whole text would"""
+        error = self.get_error()
+        if error is not None:
+            raise error
+
+        return CodeBox([segment.node for segment in self._segments])
+
+    def get_module_bytes(self, optimize=False, fold_constants=False):
+        """Emits module from current nodes, takes same options as compilation.compile_source"""
+        root_code = self.get_root_code()
+
+        if fold_constants:
+            root_code = root_code.fold_constants()
+
+        return get_module_bytes(root_code, PeepholeOptimizer() if optimize else None)
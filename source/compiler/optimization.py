@@ -0,0 +1,77 @@
+from source.compiler.bytecodes import Opcodes
+
+
+_PUSH_OPCODES = frozenset((Opcodes.PUSH_MYSELF, Opcodes.PUSH_LITERAL))
+
+
+def remove_noops(instructions):
+    """Drops NOOP instructions"""
+    return [instruction for instruction in instructions if instruction[0] != Opcodes.NOOP]
+
+
+def remove_push_pull_pairs(instructions):
+    """Drops pushes whose value is immediately thrown away by PULL, together with that PULL"""
+    result = []
+
+    for instruction in instructions:
+        if instruction[0] == Opcodes.PULL and result and result[-1][0] in _PUSH_OPCODES:
+            result.pop()
+            continue
+
+        result.append(instruction)
+
+    return result
+
+
+DEFAULT_PASSES = (
+    remove_noops,
+    remove_push_pull_pairs,
+)
+
+
+class PeepholeOptimizer:
+    """
+    Runs pluggable passes over finished instruction stream of every code context it is given to
+    (through BytecodeWriter). Pass is function which takes list of (opcode, parameter) instructions
+    and returns optimized list.
+
+    Literals no instruction refers to after passes are dropped from literal pool by code context itself
+    """
+    def __init__(self, passes=DEFAULT_PASSES):
+        self._passes = tuple(passes)
+
+        self._code_count = 0
+        self._instructions_before = 0
+        self._instructions_after = 0
+        self._literals_removed = 0
+
+    def optimize(self, instructions):
+        self._code_count += 1
+        self._instructions_before += len(instructions)
+
+        for optimization_pass in self._passes:
+            instructions = optimization_pass(instructions)
+
+        self._instructions_after += len(instructions)
+
+        return instructions
+
+    def record_removed_literals(self, count):
+        self._literals_removed += count
+
+    def get_statistics(self):
+        """Returns counts summed over all optimized code objects"""
+        return {
+            "code_objects": self._code_count,
+            "instructions_before": self._instructions_before,
+            "instructions_after": self._instructions_after,
+            "literals_removed": self._literals_removed,
+        }
+
+
+def fold_constants(root_code):
+    """
+    Returns copy of code box (as returned by Parser.parse_root_code) where integer operator sends
+    with constant operands are replaced by their result. Original tree is left untouched
+    """
+    return root_code.fold_constants()
@@ -2,21 +2,79 @@ import enum
 
 from source.compiler.ast_nodes import CodeBox, LiteralNode, IntegerBox, StringBox, SendNode, UnfinishedSymbolBox, \
     MyselfNode, NoneBox, CompleteSymbolBox, ObjectBox
-from source.compiler.tokenization import TokenTypes, Tokenizer
+from source.compiler.tokenization import TokenTypes, Tokenizer, TokenCursor, TokenStream, TokenBuffer, token_mask
+
+
+# precomputed token type masks, so parser checks are single integer operation
+_COMMA_MASK = token_mask(TokenTypes.COMMA)
+_COLON_MASK = token_mask(TokenTypes.COLON)
+_INTEGER_MASK = token_mask(TokenTypes.INTEGER)
+_SIMPLE_LITERAL_MASK = token_mask(TokenTypes.INTEGER, TokenTypes.STRING)
+_SEMICOLON_MASK = token_mask(TokenTypes.SEMICOLON)
+_OPERATOR_MASK = token_mask(TokenTypes.OPERATOR_SYMBOL)
+_SYMBOL_MASK = token_mask(TokenTypes.KEYWORD_SYMBOL, TokenTypes.OPERATOR_SYMBOL)
+_OBJECT_BRACKET_CLOSE_MASK = token_mask(TokenTypes.OBJECT_BRACKET_CLOSE)
+_OBJECT_SLOTS_END_MASK = token_mask(TokenTypes.OBJECT_BRACKET_CLOSE, TokenTypes.SEMICOLON)
+
+# token values parser looks for
+_OPEN_PARENTHESIS = ("(",)
+_CLOSE_PARENTHESIS = (")",)
+_ASSIGNMENT = ("=",)
 
 
 class ParserError(Exception):
-    pass
+    """Position is (line, column) when parser had line index, plain source offset otherwise"""
+    def __init__(self, message, position=None):
+        super().__init__(message)
+
+        self._position = position
+
+    def get_position(self):
+        return self._position
+
+    def __reduce__(self):
+        return type(self), (self.args[0], self._position)
+
 
 class Parser:
-    def __init__(self, tokens):
+    def __init__(self, tokens, collapsed_whitespace=False, line_index=None):
+        """
+        Tokens can be list of tokens, any token iterator (e.g. Tokenizer.iter_tokens)
+        or object which already provides peek_token/pull_token.
+
+        Set collapsed_whitespace if tokens come from Tokenizer with collapse_whitespace enabled.
+        Line index (see Tokenizer.get_line_index) is used to report error positions as lines and columns.
+        It can also be given as function returning it (e.g. Tokenizer.get_line_index itself), which is called
+        only when error is reported, so index is not built for sources which parse fine
+        """
+        if line_index is None and isinstance(tokens, TokenBuffer):
+            line_index = tokens.get_line_index
+
+        if isinstance(tokens, list):
+            tokens = TokenCursor(tokens)
+        elif not hasattr(tokens, "peek_token"):
+            tokens = TokenStream(tokens)
+
         self._tokens = tokens
-        self._tokens_index = 0
+
+        # parser peeks and pulls for every token, so token source methods are bound only once.
+        # Pull returns token and moves forward
+        self._peek_token = tokens.peek_token
+        self._pull_token = tokens.pull_token
+        self._collapsed_whitespace = collapsed_whitespace
+        self._line_index = line_index
 
     def _consume_whitespaces(self):
         """Jumps over all whitespace tokens in token list"""
 
-        while self._peek_token()[0].value == TokenTypes.WHITESPACE.value:
+        if self._collapsed_whitespace:
+            # whitespace runs are single tokens, so there is at most one to jump over
+            if self._peek_token()[0] is TokenTypes.WHITESPACE:
+                self._pull_token()
+
+            return
+
+        while self._peek_token()[0] is TokenTypes.WHITESPACE:
             self._pull_token()
 
     def _check_consume_token_value(self, token_values):
@@ -37,11 +95,9 @@ class Parser:
 
         return result
 
-    def _check_token_type(self, wanted_token_types):
-        """Checks if current token has type we want"""
-        token_type, _, _ = self._peek_token()
-
-        return token_type.value in (t.value for t in wanted_token_types)
+    def _check_token_type(self, wanted_token_mask):
+        """Checks if current token has type we want, wanted types are given as mask (see token_mask)"""
+        return (1 << self._peek_token()[0]) & wanted_token_mask != 0
 
 
     def _check_token_value(self, wanted_token_values):
@@ -50,37 +106,38 @@ class Parser:
 
         return token_value in wanted_token_values
 
-    def _peek_token(self):
-        return self._tokens[self._tokens_index]
 
-    def _pull_token(self):
-        """Returns token and moved index forward"""
-        prev_index = self._tokens_index
-        self._tokens_index += 1
 
-        return self._tokens[prev_index]
+    def _raise_ParserError(self, expected_token, found_token, position):
+        # tokens carry only source offsets, turn it into line and column if possible
+        line_index = self._line_index
 
+        if callable(line_index):
+            line_index = line_index()
+
+        if line_index is not None:
+            position = line_index.position_of(position)
 
-    def _raise_ParserError(self, expected_token, found_token, position):
         raise ParserError(
             "At {}: expected {}, found {} instead".format(
                 position,
                 expected_token,
                 found_token
-            )
+            ),
+            position
         )
 
     def parse_root_code(self):
-        expression_list = []
+        return CodeBox(list(self.iter_root_expressions()))
 
+    def iter_root_expressions(self):
+        """Yields top-level expressions of root code one by one, each after its terminating comma was consumed"""
         token_type, _, _ = self._peek_token()
 
-        while token_type != TokenTypes.EOF:
-            expression_list.append(
-                self.parse_expression()
-            )
+        while token_type is not TokenTypes.EOF:
+            expression = self.parse_expression()
 
-            if not self._check_consume_token_type([TokenTypes.COMMA]):
+            if not self._check_consume_token_type(_COMMA_MASK):
                 error_type, error_pos, error_value = self._peek_token()
 
                 self._raise_ParserError(
@@ -89,30 +146,52 @@ class Parser:
                     position=error_pos
                 )
 
-            token_type, _, _ = self._peek_token()
+            yield expression
 
-        return CodeBox(expression_list)
+            token_type, _, _ = self._peek_token()
 
 
     def parse_expression(self):
+        return self._run_rule(self._expression_rule())
+
+    def _run_rule(self, rule):
+        """
+        Runs grammar rule and returns its result. Every rule is generator which yields rule it wants to be parsed
+        and receives its result back, here such sub-rules are run recursively on Python call stack
+        """
+        try:
+            sub_rule = rule.send(None)
+
+            while True:
+                sub_rule = rule.send(self._run_rule(sub_rule))
+        except StopIteration as finished:
+            return finished.value
+
+    def _expression_rule(self):
         main_term = None
 
+        # expression rule runs for every expression of source, so token checks are inlined here
+        peek_token = self._peek_token
+        pull_token = self._pull_token
+
         # consume whitespaces before expression itself
         self._consume_whitespaces()
 
+        token_type, token_location, token_value = peek_token()
 
         # handle parenthesis
-        if self._check_consume_token_value(["("]):
+        if token_value in _OPEN_PARENTHESIS:
+            pull_token()
 
             # parse expression
-            main_term = self.parse_expression()
+            main_term = yield self._expression_rule()
 
             # consume whitespaces between expression and closing bracket
             self._consume_whitespaces()
 
             # check if there is closing bracket and if not, error
-            if not self._check_consume_token_value( [")"] ):
-                error_type, error_pos, error_value = self._peek_token()
+            if not self._check_consume_token_value(_CLOSE_PARENTHESIS):
+                error_type, error_pos, error_value = peek_token()
 
                 self._raise_ParserError(
                     expected_token=(TokenTypes.BRACKET_CLOSE, ")"),
@@ -121,32 +200,37 @@ class Parser:
                 )
 
         # handle normal expression (without parenthesis)
-        else:
-            token_type, token_location, token_value = self._peek_token()
-
+        # TODO: This is extremely brain damaged approach, but i don' know how to solve it right now
+        elif (1 << token_type) & _SYMBOL_MASK:
+            pull_token()
+            selector = UnfinishedSymbolBox(token_value)
 
-            # TODO: This is extremely brain damaged approach, but i don' know how to solve it right now
-            if token_type.value in (TokenTypes.KEYWORD_SYMBOL.value, TokenTypes.OPERATOR_SYMBOL.value):
-                self._pull_token()
-                selector = UnfinishedSymbolBox(token_value)
-                parameters = self._parse_message_arguments()
+            # argument list rule is run only when there is any
+            parameters = []
+            if peek_token()[2] in _OPEN_PARENTHESIS:
+                parameters = yield self._message_arguments_rule()
 
-                main_term = SendNode(
-                    receiver=MyselfNode(),
-                    selector=selector,
-                    parameters=parameters
-                )
-            else:
-                main_term = self._parse_literal()
+            main_term = SendNode(
+                receiver=MyselfNode(),
+                selector=selector,
+                parameters=parameters
+            )
+        elif (1 << token_type) & _SIMPLE_LITERAL_MASK:
+            # integer and string literals contain nothing to parse, so literal rule is not run for them
+            pull_token()
+            main_term = LiteralNode(self._make_simple_literal(token_type, token_value))
+        else:
+            main_term = LiteralNode((yield self._literal_rule()))
 
         # handle possible sends
         self._consume_whitespaces()
 
-        while self._check_consume_token_type([TokenTypes.COLON]):
-            token_type, token_location, token_value = self._pull_token()
+        while (1 << peek_token()[0]) & _COLON_MASK:
+            pull_token()
+            token_type, token_location, token_value = pull_token()
 
             # next token MUST BE a symbol of any kind
-            if not token_type.value in (TokenTypes.OPERATOR_SYMBOL.value, TokenTypes.KEYWORD_SYMBOL.value):
+            if not (1 << token_type) & _SYMBOL_MASK:
                 self._raise_ParserError(
                     expected_token=[TokenTypes.KEYWORD_SYMBOL, TokenTypes.OPERATOR_SYMBOL],
                     found_token=(token_type, token_value),
@@ -155,7 +239,9 @@ class Parser:
 
             selector = UnfinishedSymbolBox(token_value)
 
-            parameters = self._parse_message_arguments()
+            parameters = []
+            if peek_token()[2] in _OPEN_PARENTHESIS:
+                parameters = yield self._message_arguments_rule()
 
             main_term = SendNode(
                 receiver=main_term,
@@ -166,10 +252,9 @@ class Parser:
             #consume any following whitespaces
             self._consume_whitespaces()
 
-
-        while self._check_token_type( [TokenTypes.OPERATOR_SYMBOL] ):
+        while (1 << peek_token()[0]) & _OPERATOR_MASK:
             # get selector
-            _, token_location, token_value = self._pull_token()
+            _, token_location, token_value = pull_token()
 
             selector = UnfinishedSymbolBox(token_value)
 
@@ -178,8 +263,8 @@ class Parser:
 
             parameters = []
 
-            if not self._check_token_type( [TokenTypes.COMMA] ):
-                parameters = [ self.parse_expression() ]
+            if not (1 << peek_token()[0]) & _COMMA_MASK:
+                parameters = [ (yield self._expression_rule()) ]
 
             main_term = SendNode(
                 receiver=main_term,
@@ -189,18 +274,21 @@ class Parser:
 
         return main_term
 
-    def _parse_literal(self):
+    def _make_simple_literal(self, token_type, token_value):
+        if token_type is TokenTypes.INTEGER:
+            return IntegerBox(token_value)
+
+        return StringBox(token_value)
+
+    def _literal_rule(self):
         token_type, token_position, token_value = self._pull_token()
 
         # TODO: Fix this brain damage approach
-        if token_type.value == TokenTypes.INTEGER.value:
-            return IntegerBox(token_value)
-
-        if token_type.value == TokenTypes.STRING.value:
-            return StringBox(token_value)
+        if (1 << token_type) & _SIMPLE_LITERAL_MASK:
+            return self._make_simple_literal(token_type, token_value)
 
-        if token_type.value == TokenTypes.OBJECT_BRACKET_OPEN.value:
-            return self._parse_object()
+        if token_type is TokenTypes.OBJECT_BRACKET_OPEN:
+            return (yield self._object_rule())
 
         #unknown literal
         self._raise_ParserError(
@@ -210,14 +298,14 @@ class Parser:
         )
         return None
 
-    def _parse_object(self):
+    def _object_rule(self):
         slots = []
         code = None
 
         self._consume_whitespaces()
-        while not self._check_token_type( [TokenTypes.OBJECT_BRACKET_CLOSE, TokenTypes.SEMICOLON] ):
+        while not self._check_token_type(_OBJECT_SLOTS_END_MASK):
             #take slot name
-            if not self._check_token_type([TokenTypes.OPERATOR_SYMBOL, TokenTypes.KEYWORD_SYMBOL]):
+            if not self._check_token_type(_SYMBOL_MASK):
                 error_type, error_pos, error_value = self._peek_token()
 
                 self._raise_ParserError(
@@ -229,7 +317,7 @@ class Parser:
             _, _, slot_name = self._pull_token()
 
             ## take arity
-            if not self._check_consume_token_value(["("]):
+            if not self._check_consume_token_value(_OPEN_PARENTHESIS):
                 error_type, error_pos, error_value = self._peek_token()
 
                 self._raise_ParserError(
@@ -238,7 +326,7 @@ class Parser:
                     position=error_pos
                 )
 
-            if not self._check_token_type([TokenTypes.INTEGER]):
+            if not self._check_token_type(_INTEGER_MASK):
                 error_type, error_pos, error_value = self._peek_token()
 
                 self._raise_ParserError(
@@ -247,10 +335,9 @@ class Parser:
                     position=error_pos
                 )
 
-
             _, position, arity = self._pull_token()
 
-            if not self._check_consume_token_value([")"]):
+            if not self._check_consume_token_value(_CLOSE_PARENTHESIS):
                 error_type, error_pos, error_value = self._peek_token()
 
                 self._raise_ParserError(
@@ -267,8 +354,8 @@ class Parser:
             slot_content = NoneBox()
 
             # if there is no comma, there is value to load
-            if not self._check_token_type([TokenTypes.COMMA]):
-                if not self._check_token_value(["="]):
+            if not self._check_token_type(_COMMA_MASK):
+                if not self._check_token_value(_ASSIGNMENT):
                     error_type, error_pos, error_value = self._peek_token()
 
                     self._raise_ParserError(
@@ -281,10 +368,10 @@ class Parser:
                 self._consume_whitespaces()
 
                 # read value (literal)
-                slot_content = self._parse_literal()
+                slot_content = yield self._literal_rule()
 
                 self._consume_whitespaces()
-                if not self._check_token_type([TokenTypes.COMMA]):
+                if not self._check_token_type(_COMMA_MASK):
                     error_type, error_pos, error_value = self._peek_token()
 
                     self._raise_ParserError(
@@ -297,22 +384,22 @@ class Parser:
             self._pull_token()
 
             slots.append((
-                CompleteSymbolBox(slot_name, arity),
+                CompleteSymbolBox(arity, slot_name),
                 (), #TODO: Implement slot kind handling
                 slot_content
             ))
 
             self._consume_whitespaces()
 
-        if self._check_token_type([TokenTypes.SEMICOLON]):
+        if self._check_token_type(_SEMICOLON_MASK):
             self._pull_token()
 
             code = []
-            while not self._check_consume_token_type([TokenTypes.OBJECT_BRACKET_CLOSE]):
-                code.append(self.parse_expression())
+            while not self._check_consume_token_type(_OBJECT_BRACKET_CLOSE_MASK):
+                code.append((yield self._expression_rule()))
 
                 # check and consume token
-                if not self._check_consume_token_type([TokenTypes.COMMA]):
+                if not self._check_consume_token_type(_COMMA_MASK):
                     error_type, error_pos, error_value = self._peek_token()
 
                     self._raise_ParserError(
@@ -330,10 +417,10 @@ class Parser:
             code=code
         )
 
-    def _parse_message_arguments(self):
+    def _message_arguments_rule(self):
         arguments = []
 
-        if not self._check_token_value(["("]):
+        if not self._check_token_value(_OPEN_PARENTHESIS):
             return arguments
 
         # consume opening bracket
@@ -341,24 +428,22 @@ class Parser:
 
         while True:
 
-            arguments.append(
-                self.parse_expression()
-            )
+            arguments.append((yield self._expression_rule()))
 
-            if self._check_token_value([")"]):
+            token_type, token_position, token_value = self._peek_token()
+
+            if token_value in _CLOSE_PARENTHESIS:
                 self._pull_token()
                 break
 
-            if self._check_token_type([TokenTypes.COMMA]):
+            if (1 << token_type) & _COMMA_MASK:
                 self._pull_token()
                 continue
 
-            error_type, error_pos, error_value = self._peek_token()
-
             self._raise_ParserError(
                 expected_token=[TokenTypes.COMMA, TokenTypes.BRACKET_CLOSE],
-                found_token=(error_type, error_value),
-                position=error_pos
+                found_token=(token_type, token_value),
+                position=token_position
             )
         return arguments
 
@@ -366,4 +451,33 @@ class Parser:
         pass
 
     def parse_any(self):
-        pass
\ No newline at end of file
+        pass
+
+class IterativeParser(Parser):
+    """
+    Builds the same trees as Parser, but does not recurse on Python call stack.
+
+    Grammar rules are driven by explicit stack instead, so nesting depth is limited only by available memory
+    """
+    def _run_rule(self, rule):
+        stack = [rule]
+        result = None
+
+        while stack:
+            try:
+                sub_rule = stack[-1].send(result)
+            except StopIteration as finished:
+                stack.pop()
+                result = finished.value
+            else:
+                stack.append(sub_rule)
+                result = None
+
+        return result
+
+
+# parsers by name, as command line options refer to them
+PARSER_CLASSES = {
+    "recursive": Parser,
+    "iterative": IterativeParser,
+}
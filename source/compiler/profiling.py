@@ -0,0 +1,154 @@
+import collections
+import contextlib
+import json
+import time
+
+from source.compiler.ast_nodes import SendNode, ExplicitReturnNode, LiteralNode, CodeBox, ObjectBox
+from source.compiler.tokenization import TokenBuffer
+
+
+# statistics of one finished code context
+CodeStatistics = collections.namedtuple("CodeStatistics", ("literal_count", "bytecode_length", "stack_usage"))
+
+CompileReport = collections.namedtuple("CompileReport", (
+    "label",
+    "source_length",
+    "module_length",
+    "cache_hit",
+    "stage_seconds",
+    "token_counts",
+    "node_counts",
+    "codes",
+))
+
+
+def _get_child_nodes(node):
+    """Returns nodes and boxes directly contained in node"""
+    if isinstance(node, SendNode):
+        return [node.get_receiver(), node.get_selector(), *node.get_parameters()]
+    if isinstance(node, LiteralNode):
+        return [node.get_literal_value()]
+    if isinstance(node, ExplicitReturnNode):
+        return [node.get_return_node()]
+    if isinstance(node, CodeBox):
+        return node.get_value()
+    if isinstance(node, ObjectBox):
+        child_nodes = []
+
+        for slot_name, _, slot_content in node.get_slots():
+            child_nodes.append(slot_name)
+            child_nodes.append(slot_content)
+
+        if node.get_code() is not None:
+            child_nodes.append(node.get_code())
+
+        return child_nodes
+
+    return []
+
+
+class CompileProfiler:
+    """
+    Collects stage timings and statistics of compilation. Profiling is opt-in, compiler only calls
+    profiler which was handed to it (compile_source, get_module_bytes, write_module, BytecodeWriter),
+    so disabled profiling costs one None check per stage and per code context.
+
+    One profiler is meant for one compilation, label identifies it in reports (usually source path)
+    """
+    def __init__(self, label=None):
+        self._label = label
+
+        self._source_length = None
+        self._module_length = None
+
+        # stays None when compilation did not go through cache
+        self._cache_hit = None
+
+        self._stage_seconds = {}
+        self._token_counts = {}
+        self._node_counts = {}
+        self._codes = []
+
+    @contextlib.contextmanager
+    def measure_stage(self, stage_name):
+        """Context manager adding wall time of its block to given stage"""
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stage_seconds[stage_name] = self._stage_seconds.get(stage_name, 0.0) + elapsed
+
+    def record_tokens(self, tokens):
+        """Counts tokens by type, tokens may be TokenBuffer or any iterable of token tuples"""
+        if isinstance(tokens, TokenBuffer):
+            token_counts = tokens.count_token_types()
+        else:
+            token_counts = collections.Counter(token_type for token_type, _, _ in tokens)
+
+        for token_type, count in token_counts.items():
+            if count:
+                self._token_counts[token_type.name] = self._token_counts.get(token_type.name, 0) + count
+
+    def record_tree(self, root_code):
+        """Counts nodes of tree by class"""
+        node_counts = collections.Counter()
+
+        pending_nodes = [root_code]
+        while pending_nodes:
+            node = pending_nodes.pop()
+
+            node_counts[type(node).__name__] += 1
+            pending_nodes.extend(_get_child_nodes(node))
+
+        for class_name, count in node_counts.items():
+            self._node_counts[class_name] = self._node_counts.get(class_name, 0) + count
+
+    def record_code(self, literal_count, bytecode_length, stack_usage):
+        """Called by code context when it is finished"""
+        self._codes.append(CodeStatistics(literal_count, bytecode_length, stack_usage))
+
+    def record_module(self, source_length, module_length):
+        self._source_length = source_length
+        self._module_length = module_length
+
+    def record_cache_hit(self, cache_hit):
+        self._cache_hit = cache_hit
+
+    def get_report(self):
+        return CompileReport(
+            label=self._label,
+            source_length=self._source_length,
+            module_length=self._module_length,
+            cache_hit=self._cache_hit,
+            stage_seconds=dict(self._stage_seconds),
+            token_counts=dict(self._token_counts),
+            node_counts=dict(self._node_counts),
+            codes=list(self._codes),
+        )
+
+    def to_dict(self):
+        """Returns report as plain dictionary. Code statistics are summarized, since there can be thousands of them"""
+        report = self.get_report()
+
+        return {
+            "label": report.label,
+            "source_length": report.source_length,
+            "module_length": report.module_length,
+            "cache_hit": report.cache_hit,
+            "stage_seconds": report.stage_seconds,
+            "token_counts": report.token_counts,
+            "node_counts": report.node_counts,
+            "code_count": len(report.codes),
+            "literal_count": sum(code.literal_count for code in report.codes),
+            "max_literal_count": max((code.literal_count for code in report.codes), default=0),
+            "bytecode_length": sum(code.bytecode_length for code in report.codes),
+            "max_stack_usage": max((code.stack_usage for code in report.codes), default=0),
+        }
+
+    def to_json_line(self):
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    def write_json_line(self, file):
+        file.write(self.to_json_line() + "\n")
@@ -0,0 +1,313 @@
+import collections
+import io
+
+from source.compiler.ast_nodes import BytecodeWriter
+from source.compiler.bytecodes import CORRECT_MODULE_SIGNATURE, MODULE_FORMAT_VERSION, LiteralTags, Opcodes, \
+    iter_instructions, measure_stack_depth, BytecodeVerificationError
+
+
+# how many bytes are collected before they are written out to file
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_MODULE_SIGNATURE = bytes(CORRECT_MODULE_SIGNATURE)
+
+_KNOWN_OPCODES = frozenset(
+    value for name, value in vars(Opcodes).items() if name.isupper()
+)
+
+# opcodes whose parameter is index into literal pool
+_LITERAL_OPCODES = frozenset((Opcodes.PUSH_LITERAL, Opcodes.SEND))
+
+
+class ModuleFormatError(Exception):
+    pass
+
+
+# decoded forms of literals, as returned by ModuleReader
+DecodedSymbol = collections.namedtuple("DecodedSymbol", ("arity", "name"))
+DecodedObject = collections.namedtuple("DecodedObject", ("slots", "code"))
+DecodedCode = collections.namedtuple("DecodedCode", ("stack_usage", "literals", "bytecode"))
+
+
+class StreamingBytecodeWriter(BytecodeWriter):
+    """
+    Bytecode writer which writes its content to file in chunks as it grows, so whole image is never held in memory.
+    Back-patches of already written parts are done by seeking, so file has to be seekable.
+
+    Optimizer can drop literals of code only once code is finished, so while code context is open,
+    its literal pool is kept in memory and nothing is written out. With optimizer, most of module is therefore
+    buffered until root code is finished
+    """
+    def __init__(self, file, chunk_size=DEFAULT_CHUNK_SIZE, optimizer=None, profiler=None):
+        super().__init__(optimizer, profiler)
+
+        self._file = file
+        self._chunk_size = chunk_size
+
+        # where in file output starts and how many bytes were already written there
+        self._file_start = file.tell()
+        self._flushed = 0
+
+        # number of open literal pools, output is held back while there is any
+        self._held_pools = 0
+
+    def hold_literal_pool(self):
+        self._held_pools += 1
+
+    def release_literal_pool(self):
+        self._held_pools -= 1
+
+        if len(self._buffer) >= self._chunk_size:
+            self.flush()
+
+    def tell(self):
+        return self._flushed + len(self._buffer)
+
+    def write_byte(self, value):
+        self._buffer.append(value)
+
+        if len(self._buffer) >= self._chunk_size:
+            self.flush()
+
+    def write_bytes(self, data):
+        self._buffer += data
+
+        if len(self._buffer) >= self._chunk_size:
+            self.flush()
+
+    def write_integer(self, value):
+        self.write_bytes(value.to_bytes(8, byteorder="big", signed=True))
+
+    def reserve_integer(self):
+        offset = self.tell()
+        self.write_bytes(bytes(8))
+
+        return offset
+
+    def patch_integer(self, offset, value):
+        if offset >= self._flushed:
+            super().patch_integer(offset - self._flushed, value)
+            return
+
+        # patched place was already written out, it is overwritten in file
+        self._file.seek(self._file_start + offset)
+        self._file.write(value.to_bytes(8, byteorder="big", signed=True))
+        self._file.seek(self._file_start + self._flushed)
+
+    def remove_ranges(self, ranges):
+        # removed literals belong to held literal pool, so they are never written out
+        if ranges[0][0] < self._flushed:
+            raise ValueError("Cannot remove bytes which were already written out")
+
+        super().remove_ranges([(start - self._flushed, end - self._flushed) for start, end in ranges])
+
+    def flush(self):
+        """Writes buffered bytes out to file, unless some literal pool is held"""
+        if self._buffer and not self._held_pools:
+            self._file.write(self._buffer)
+
+            self._flushed += len(self._buffer)
+            self._buffer = bytearray()
+
+    def get_bytes(self):
+        raise io.UnsupportedOperation("Content of streaming writer lives in its file")
+
+
+def write_module_header(writer):
+    writer.write_bytes(_MODULE_SIGNATURE)
+    writer.write_integer(MODULE_FORMAT_VERSION)
+
+
+def write_module(root_code, file, chunk_size=DEFAULT_CHUNK_SIZE, optimizer=None, profiler=None):
+    """
+    Streams module (signature, header and compiled root code, as returned by Parser.parse_root_code) into file.
+    Returns number of bytes written
+    """
+    writer = StreamingBytecodeWriter(file, chunk_size, optimizer, profiler)
+
+    write_module_header(writer)
+    root_code.write_into(writer)
+
+    writer.flush()
+
+    return writer.tell()
+
+
+def get_module_bytes(root_code, optimizer=None, profiler=None):
+    """Returns whole module image as bytes"""
+    writer = BytecodeWriter(optimizer, profiler)
+
+    write_module_header(writer)
+    root_code.write_into(writer)
+
+    return writer.get_bytes()
+
+
+class ModuleReader:
+    """
+    Reads and validates module written by write_module.
+    Literals are decoded into plain values - None, int, str, DecodedSymbol, DecodedObject and DecodedCode
+    """
+    def __init__(self, file):
+        self._file = file
+
+    def _read(self, count):
+        data = self._file.read(count)
+
+        if len(data) != count:
+            raise ModuleFormatError("Unexpected end of module, {} more bytes expected".format(count - len(data)))
+
+        return data
+
+    def _read_byte(self):
+        return self._read(1)[0]
+
+    def _read_integer(self):
+        return int.from_bytes(self._read(8), byteorder="big", signed=True)
+
+    def _read_length(self):
+        length = self._read_integer()
+
+        if length < 0:
+            raise ModuleFormatError("Negative length {}".format(length))
+
+        return length
+
+    def _expect_tag(self, expected_tag):
+        tag = self._read_byte()
+
+        if tag != expected_tag:
+            raise ModuleFormatError("Expected tag {:#04x}, found {:#04x}".format(expected_tag, tag))
+
+    def read_module(self):
+        """Reads whole module and returns its decoded root code"""
+        signature = self._read(len(_MODULE_SIGNATURE))
+        if signature != _MODULE_SIGNATURE:
+            raise ModuleFormatError("Wrong module signature {!r}".format(signature))
+
+        version = self._read_integer()
+        if version != MODULE_FORMAT_VERSION:
+            raise ModuleFormatError("Unsupported module format version {}".format(version))
+
+        self._expect_tag(LiteralTags.VM_CODE)
+        root_code = self._read_code()
+
+        if self._file.read(1):
+            raise ModuleFormatError("Unexpected data after root code")
+
+        return root_code
+
+    def _read_literal(self):
+        tag = self._read_byte()
+
+        if tag == LiteralTags.VM_NONE:
+            return None
+
+        if tag == LiteralTags.VM_SMALL_INTEGER:
+            return self._read_integer()
+
+        if tag == LiteralTags.VM_STRING:
+            return self._read_text()
+
+        if tag == LiteralTags.VM_SYMBOL:
+            return self._read_symbol()
+
+        if tag == LiteralTags.VM_OBJECT:
+            return self._read_object()
+
+        if tag == LiteralTags.VM_CODE:
+            return self._read_code()
+
+        raise ModuleFormatError("Unknown literal tag {:#04x}".format(tag))
+
+    def _read_text(self):
+        try:
+            return self._read(self._read_length()).decode("utf-8")
+        except UnicodeDecodeError as error:
+            raise ModuleFormatError("Text is not valid UTF-8") from error
+
+    def _read_symbol(self):
+        arity = self._read_integer()
+
+        if arity < 0:
+            raise ModuleFormatError("Negative symbol arity {}".format(arity))
+
+        return DecodedSymbol(arity, self._read_text())
+
+    def _read_object(self):
+        slots = []
+
+        for _ in range(self._read_length()):
+            slot_kind = self._read_byte()
+
+            self._expect_tag(LiteralTags.VM_SYMBOL)
+            slot_name = self._read_symbol()
+
+            slots.append((slot_kind, slot_name, self._read_literal()))
+
+        code_tag = self._read_byte()
+
+        if code_tag == LiteralTags.VM_NONE:
+            return DecodedObject(slots, None)
+
+        if code_tag != LiteralTags.VM_CODE:
+            raise ModuleFormatError("Object code must be code or none, found tag {:#04x}".format(code_tag))
+
+        return DecodedObject(slots, self._read_code())
+
+    def _read_code(self):
+        stack_usage = self._read_integer()
+
+        self._expect_tag(LiteralTags.VM_OBJECT_ARRAY)
+        literals = [self._read_literal() for _ in range(self._read_length())]
+
+        self._expect_tag(LiteralTags.VM_BYTE_ARRAY)
+        bytecode = self._read(self._read_length())
+
+        self._validate_bytecode(bytecode, literals)
+        self._validate_stack_usage(stack_usage, bytecode, literals)
+
+        return DecodedCode(stack_usage, literals, bytecode)
+
+    def _validate_bytecode(self, bytecode, literals):
+        try:
+            instructions = list(iter_instructions(bytecode))
+        except ValueError as error:
+            raise ModuleFormatError(str(error)) from error
+
+        for offset, opcode, parameter in instructions:
+            if opcode not in _KNOWN_OPCODES:
+                raise ModuleFormatError("Unknown opcode {:#04x} at {}".format(opcode, offset))
+
+            if opcode not in _LITERAL_OPCODES:
+                continue
+
+            if parameter >= len(literals):
+                raise ModuleFormatError("Literal index {} at {} is out of range".format(parameter, offset))
+
+            if opcode == Opcodes.SEND and not isinstance(literals[parameter], DecodedSymbol):
+                raise ModuleFormatError("Send at {} does not refer to symbol".format(offset))
+
+
+    def _validate_stack_usage(self, stack_usage, bytecode, literals):
+        selector_arities = {
+            index: literal.arity for index, literal in enumerate(literals) if isinstance(literal, DecodedSymbol)
+        }
+
+        try:
+            measured_usage = measure_stack_depth(bytecode, selector_arities)
+        except BytecodeVerificationError as error:
+            raise ModuleFormatError(str(error)) from error
+
+        if stack_usage < measured_usage:
+            raise ModuleFormatError(
+                "Code declares stack usage {}, but needs {}".format(stack_usage, measured_usage)
+            )
+
+
+def read_module(file):
+    return ModuleReader(file).read_module()
+
+
+def read_module_bytes(module_bytes):
+    return read_module(io.BytesIO(module_bytes))
@@ -0,0 +1,365 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import stat
+import sys
+
+from source.compiler.compilation import BatchCompiler, COMPILATION_ERRORS, SMALL_SOURCE_LENGTH
+from source.compiler.parsing import ParserError
+from source.compiler.tokenization import TokenizerError
+
+
+# Protocol: every message is frame - 4 byte big-endian length followed by payload.
+# Request is JSON header frame {"id", "optimize", "fold_constants"} followed by frame with UTF-8 source.
+# Response is JSON header frame {"id", "status", "diagnostic"} followed by frame with module bytes
+# (empty when status is "error"). Requests of one connection may be answered out of order, id pairs them up.
+
+_FRAME_LENGTH_SIZE = 4
+
+# frames longer than this are refused, so broken client cannot make service allocate arbitrary memory
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+# sources up to this size are compiled right in event loop, sending them to worker would cost more than compiling
+DEFAULT_INLINE_SIZE = 2048
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def _encode_frame(payload):
+    return len(payload).to_bytes(_FRAME_LENGTH_SIZE, byteorder="big") + payload
+
+
+async def read_frame(reader):
+    """Reads one frame, returns None if stream ended cleanly before it"""
+    try:
+        length_bytes = await reader.readexactly(_FRAME_LENGTH_SIZE)
+    except asyncio.IncompleteReadError as error:
+        if error.partial:
+            raise ProtocolError("Stream ended inside frame length") from error
+        return None
+
+    length = int.from_bytes(length_bytes, byteorder="big")
+    if length > MAX_FRAME_SIZE:
+        raise ProtocolError("Frame of {} bytes is over limit {}".format(length, MAX_FRAME_SIZE))
+
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError as error:
+        raise ProtocolError("Stream ended inside frame") from error
+
+
+def write_frames(writer, *payloads):
+    writer.write(b"".join(_encode_frame(payload) for payload in payloads))
+
+
+def _encode_header(header):
+    return json.dumps(header, separators=(",", ":")).encode("utf-8")
+
+
+def _decode_header(payload):
+    try:
+        header = json.loads(payload)
+    except ValueError as error:
+        raise ProtocolError("Header is not valid JSON") from error
+
+    if not isinstance(header, dict):
+        raise ProtocolError("Header must be JSON object")
+
+    return header
+
+
+def get_diagnostic(error):
+    """
+    Describes compilation error as JSON-friendly dictionary with type and message.
+    Line and column (from zero) are added when error knows them, plain source offset otherwise
+    """
+    diagnostic = {"type": type(error).__name__, "message": str(error)}
+
+    if isinstance(error, TokenizerError):
+        position, diagnostic["message"] = error.args
+    elif isinstance(error, ParserError):
+        position = error.get_position()
+    else:
+        return diagnostic
+
+    if isinstance(position, tuple):
+        diagnostic["line"], diagnostic["column"] = position
+    elif position is not None:
+        diagnostic["offset"] = position
+
+    return diagnostic
+
+
+# compilers of current process, one per options combination, created on first use
+_compilers = {}
+
+
+def compile_request(source, optimize=False, fold_constants=False):
+    """
+    Compiles UTF-8 encoded source with compiler kept warm in current process.
+    Returns (module bytes, None) or (None, diagnostic) when source cannot be compiled
+    """
+    compiler = _compilers.get((optimize, fold_constants))
+    if compiler is None:
+        compiler = _compilers[optimize, fold_constants] = BatchCompiler(optimize, fold_constants)
+
+    try:
+        # small sources are faster to compile as text (see BatchCompiler), big ones are scanned as bytes
+        if len(source) <= SMALL_SOURCE_LENGTH:
+            source = bytes(source).decode("utf-8")
+
+        return compiler.compile(source), None
+    except COMPILATION_ERRORS as error:
+        return None, get_diagnostic(error)
+
+
+class CompileService:
+    """
+    Long-running compile service. Small sources are compiled directly in event loop,
+    bigger ones in pool of worker processes. At most max_concurrent compilations are in progress at once,
+    when limit is reached, service stops reading new requests until some compilation finishes
+    """
+    def __init__(self, workers=None, max_concurrent=None, inline_size=DEFAULT_INLINE_SIZE):
+        self._workers = workers or os.cpu_count() or 1
+        self._max_concurrent = max_concurrent or self._workers * 2
+        self._inline_size = inline_size
+
+        self._executor = None
+        self._semaphore = None
+
+    def start(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self._workers)
+            self._semaphore = asyncio.Semaphore(self._max_concurrent)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    async def compile(self, source, optimize=False, fold_constants=False):
+        """Compiles source without waiting for limit, returns same pair as compile_request"""
+        if len(source) <= self._inline_size:
+            return compile_request(source, optimize, fold_constants)
+
+        executor = self._executor
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, compile_request, source, optimize, fold_constants
+            )
+        except concurrent.futures.BrokenExecutor:
+            # broken pool would fail every later request too, so it is replaced (once, by first failed request)
+            if self._executor is executor:
+                executor.shutdown(wait=False)
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self._workers)
+
+            raise
+
+    async def _answer(self, header, source, writer, write_lock):
+        try:
+            module_bytes, diagnostic = await self.compile(
+                source,
+                bool(header.get("optimize", False)),
+                bool(header.get("fold_constants", False))
+            )
+        except Exception as error:
+            # failure which is not error in source (bug, killed worker) is still answered, client would wait forever
+            module_bytes, diagnostic = None, get_diagnostic(error)
+        finally:
+            self._semaphore.release()
+
+        response = {"id": header.get("id"), "status": "ok" if diagnostic is None else "error"}
+        if diagnostic is not None:
+            response["diagnostic"] = diagnostic
+
+        async with write_lock:
+            write_frames(writer, _encode_header(response), module_bytes or b"")
+            await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        """Answers requests of one connection until client closes it"""
+        write_lock = asyncio.Lock()
+        pending = set()
+
+        try:
+            while True:
+                header_payload = await read_frame(reader)
+                if header_payload is None:
+                    break
+
+                header = _decode_header(header_payload)
+
+                source = await read_frame(reader)
+                if source is None:
+                    raise ProtocolError("Stream ended before source frame")
+
+                await self._semaphore.acquire()
+
+                task = asyncio.create_task(self._answer(header, source, writer, write_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except ProtocolError as error:
+            # stream cannot be trusted after broken frame, error is reported and connection closed
+            async with write_lock:
+                response = {"id": None, "status": "error", "diagnostic": get_diagnostic(error)}
+                write_frames(writer, _encode_header(response), b"")
+        except ConnectionError:
+            pass
+        finally:
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+            writer.close()
+
+    async def serve_unix(self, socket_path):
+        """Serves clients on Unix socket until cancelled"""
+        # socket left over by previous run would make bind fail, anything else at that path is kept
+        try:
+            if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+                raise FileExistsError("{} exists and is not socket".format(socket_path))
+
+            os.unlink(socket_path)
+        except FileNotFoundError:
+            pass
+
+        self.start()
+
+        try:
+            server = await asyncio.start_unix_server(self.handle_connection, socket_path)
+
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+    async def serve_stdio(self):
+        """Serves single client talking over standard input and output"""
+        self.start()
+
+        loop = asyncio.get_running_loop()
+
+        reader = asyncio.StreamReader(limit=MAX_FRAME_SIZE)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer)
+
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout.buffer)
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+
+        try:
+            await self.handle_connection(reader, writer)
+        finally:
+            self.close()
+
+
+# diagnostic given to caller when service answered with error, but did not describe it
+_MISSING_DIAGNOSTIC = {"type": "ProtocolError", "message": "Response does not report successful compilation"}
+
+
+class CompileClient:
+    """
+    Client of CompileService. Requests can be sent concurrently over one connection,
+    responses are matched to them by id
+    """
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+
+        self._next_id = 0
+        self._waiting = {}
+
+        self._receiver = asyncio.create_task(self._receive())
+
+    @classmethod
+    async def connect_unix(cls, socket_path):
+        reader, writer = await asyncio.open_unix_connection(socket_path, limit=MAX_FRAME_SIZE)
+
+        return cls(reader, writer)
+
+    async def _receive(self):
+        error = ConnectionError("Service closed connection")
+
+        try:
+            while True:
+                header_payload = await read_frame(self._reader)
+                if header_payload is None:
+                    break
+
+                header = _decode_header(header_payload)
+                module_bytes = await read_frame(self._reader)
+
+                future = self._waiting.pop(header.get("id"), None)
+                if future is None or future.done():
+                    continue
+
+                if header.get("status") == "ok":
+                    future.set_result((module_bytes, None))
+                else:
+                    future.set_result((None, header.get("diagnostic") or _MISSING_DIAGNOSTIC))
+        except (ProtocolError, ConnectionError) as receive_error:
+            error = receive_error
+        finally:
+            for future in self._waiting.values():
+                if not future.done():
+                    future.set_exception(error)
+
+            self._waiting.clear()
+
+    async def compile(self, source, optimize=False, fold_constants=False):
+        """Sends source (str or UTF-8 bytes) to service, returns (module bytes, None) or (None, diagnostic)"""
+        if isinstance(source, str):
+            source = source.encode("utf-8")
+
+        request_id = self._next_id
+        self._next_id += 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+
+        header = {"id": request_id, "optimize": optimize, "fold_constants": fold_constants}
+        write_frames(self._writer, _encode_header(header), source)
+        await self._writer.drain()
+
+        return await future
+
+    async def close(self):
+        self._writer.close()
+
+        try:
+            await self._writer.wait_closed()
+        finally:
+            await self._receiver
+
+
+def main(arguments=None):
+    argument_parser = argparse.ArgumentParser(description="Runs compile service")
+
+    channel = argument_parser.add_mutually_exclusive_group(required=True)
+    channel.add_argument("--socket", help="listen on this Unix socket")
+    channel.add_argument("--stdio", action="store_true", help="talk to single client over standard input and output")
+
+    argument_parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    argument_parser.add_argument("--max-concurrent", type=int, default=None, help="limit of compilations in progress")
+    argument_parser.add_argument("--inline-size", type=int, default=DEFAULT_INLINE_SIZE,
+                                 help="sources up to this size are compiled without worker process")
+
+    options = argument_parser.parse_args(arguments)
+
+    service = CompileService(options.workers, options.max_concurrent, options.inline_size)
+
+    try:
+        if options.stdio:
+            asyncio.run(service.serve_stdio())
+        else:
+            asyncio.run(service.serve_unix(options.socket))
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,14 @@
+import bisect
+import collections
+import contextlib
 import enum
+import mmap
+import re
+from array import array
 from xml.dom.pulldom import CHARACTERS
 
 
-class TokenTypes(enum.Enum):
+class TokenTypes(enum.IntEnum):
     INTEGER = 0
     DECIMAL = 1
 
@@ -25,6 +31,16 @@ class TokenTypes(enum.Enum):
     EOF = 13
 
 
+def token_mask(*token_types):
+    """Builds bitmask of token types. Membership of token type is then tested by single (1 << token_type) & mask"""
+    mask = 0
+
+    for token_type in token_types:
+        mask |= 1 << token_type
+
+    return mask
+
+
 OPERATOR_CHARACTERS = "".join(("+", "-", "*", "\\", "/", "%", "=", "!", "<", ">", "|", "&"))
 
 
@@ -39,24 +55,329 @@ ASCII_DIGITS = "0123456789"
 KEYWORD_CHARACTERS = ASCII_CHARACTERS + ASCII_DIGITS + "_"
 
 
+def _character_class(characters):
+    return "[" + "".join(re.escape(char) for char in characters) + "]"
+
+
+# master pattern of regex engine, every alternative is one capturing group so match.lastindex identifies token type
+# NOTE: two-character object brackets must be tried before their one-character prefixes
+_MASTER_PATTERN = re.compile(
+    "|".join((
+        r"([ \t\n\r]+)",
+        "(" + _character_class("_" + ASCII_CHARACTERS) + _character_class(KEYWORD_CHARACTERS) + "*)",
+        "(" + _character_class(ASCII_DIGITS) + "+)",
+        "(" + _character_class(OPERATOR_CHARACTERS) + "+)",
+        r'("[^"]*"?)',
+        r"(:)",
+        r"(,)",
+        r"(;[)\]}])",
+        r"(;)",
+        r"([(\[{];)",
+        r"([(\[{])",
+        r"([)\]}])",
+        r"(.)",
+    )),
+    re.DOTALL
+)
+
+# same pattern over raw bytes, used for memory-mapped sources. All token characters are ASCII,
+# so multi-byte UTF-8 sequences can only appear inside strings (or as unexpected characters)
+_MASTER_PATTERN_BYTES = re.compile(_MASTER_PATTERN.pattern.encode("ascii"), re.DOTALL)
+
+# token types indexed by group number of master pattern, None marks unexpected character
+_MASTER_PATTERN_GROUPS = (
+    None,
+    TokenTypes.WHITESPACE,
+    TokenTypes.KEYWORD_SYMBOL,
+    TokenTypes.INTEGER,
+    TokenTypes.OPERATOR_SYMBOL,
+    TokenTypes.STRING,
+    TokenTypes.COLON,
+    TokenTypes.COMMA,
+    TokenTypes.OBJECT_BRACKET_CLOSE,
+    TokenTypes.SEMICOLON,
+    TokenTypes.OBJECT_BRACKET_OPEN,
+    TokenTypes.BRACKET_OPEN,
+    TokenTypes.BRACKET_CLOSE,
+    None,
+)
+
+
 class TokenizerError(Exception):
     pass
 
 
+# int() refuses digit runs longer than sys.get_int_max_str_digits()
+_INTEGER_TOO_LONG = "Integer of {} digits is too long"
+
+
+class SourceLineIndex:
+    """
+    Offsets where lines of source start, built once per source.
+    Tokens carry plain source offsets, this translates them into human-readable (line, column) pairs in O(log n).
+
+    Source can also be bytes-like (bytes, mmap), offsets and columns are then counted in bytes.
+    Line starts are kept in typed array, list of int objects would take several times more memory than source itself
+    """
+    def __init__(self, source):
+        line_starts = array("Q", (0,))
+        find_newline = source.find
+        newline = "\n" if isinstance(source, str) else b"\n"
+
+        newline_index = find_newline(newline)
+        while newline_index != -1:
+            line_starts.append(newline_index + 1)
+            newline_index = find_newline(newline, newline_index + 1)
+
+        self._line_starts = line_starts
+
+    def __len__(self):
+        """Returns number of lines"""
+        return len(self._line_starts)
+
+    def position_of(self, offset):
+        """Returns (line, column) of source offset, both counted from zero"""
+        line = bisect.bisect_right(self._line_starts, offset) - 1
+
+        return line, offset - self._line_starts[line]
+
+
+def _describe_character(match):
+    """Returns unexpected character matched by master pattern as text"""
+    character = match.group()
+
+    if isinstance(character, str):
+        return character
+
+    # only first byte of multi-byte character was matched, whole character is decoded when it is valid
+    start = match.start()
+    decoded_character = match.string[start:start + 4].decode("utf-8", "ignore")[:1]
+
+    return decoded_character or character.decode("utf-8", "backslashreplace")
+
+
+@contextlib.contextmanager
+def map_source_file(path):
+    """
+    Context manager mapping source file into memory (read-only). Mapped file can be handed
+    to Tokenizer.tokenize_to_buffer, so big sources never have to be read and decoded as whole
+    """
+    with open(path, "rb") as source_file:
+        try:
+            mapped_source = mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file cannot be mapped
+            yield b""
+            return
+
+        with mapped_source:
+            yield mapped_source
+
+
+class TokenizerEngines(enum.Enum):
+    """Scanning engines usable by tokenizer. All of them produce the same token stream."""
+
+    # walks source one character at a time
+    CHARACTER = 0
+
+    # scans whole runs of characters at once using precompiled master regex
+    REGEX = 1
+
+
+class TokenCursor:
+    """Walks over already materialized list of tokens"""
+    def __init__(self, tokens):
+        self._tokens = tokens
+        self._tokens_index = 0
+
+    def peek_token(self):
+        return self._tokens[self._tokens_index]
+
+    def pull_token(self):
+        """Returns token and moves index forward"""
+        prev_index = self._tokens_index
+        self._tokens_index += 1
+
+        return self._tokens[prev_index]
+
+    def get_index(self):
+        """Returns index of token which will be pulled next"""
+        return self._tokens_index
+
+
+class TokenStream:
+    """
+    Pulls tokens on demand from token iterator (for example Tokenizer.iter_tokens).
+    Only tokens peeked but not pulled yet are held in lookahead buffer, so memory stays bounded
+    """
+    def __init__(self, tokens):
+        self._tokens = iter(tokens)
+        self._lookahead = collections.deque()
+
+        # EOF is sticky - once iterator is exhausted, last token is returned again
+        self._last_token = None
+
+    def _next_token(self):
+        token = next(self._tokens, None)
+
+        if token is None:
+            return self._last_token
+
+        self._last_token = token
+        return token
+
+    def peek_token(self, offset=0):
+        """Returns token which is offset tokens ahead without consuming anything"""
+        while len(self._lookahead) <= offset:
+            self._lookahead.append(self._next_token())
+
+        return self._lookahead[offset]
+
+    def pull_token(self):
+        if self._lookahead:
+            return self._lookahead.popleft()
+
+        return self._next_token()
+
+
+# token types indexed by their value, used to turn compact token kind codes back into enum members
+_TOKEN_TYPES_BY_VALUE = [None] * len(TokenTypes)
+
+for _token_type in TokenTypes:
+    _TOKEN_TYPES_BY_VALUE[_token_type.value] = _token_type
+
+# plain integer kinds for hot paths, reading value of enum member is attribute lookup every time
+_INTEGER_KIND = TokenTypes.INTEGER.value
+_STRING_KIND = TokenTypes.STRING.value
+
+
+class TokenBuffer:
+    """
+    Compact struct-of-arrays token storage. Token kinds and start/end offsets into source are stored in typed arrays,
+    token values are sliced from source only when token is requested.
+
+    Provides same peek_token/pull_token interface as other token sources, so it can be handed directly to Parser
+    """
+    def __init__(self, source):
+        self._source = source
+        self._is_text = isinstance(source, str)
+
+        self._kinds = array("B")
+        self._starts = array("I")
+        self._ends = array("I")
+
+        self._index = 0
+        self._current_token = None
+
+        self._line_index = None
+
+    def add_token(self, token_type, start, end):
+        # token types are integer enum, so they can be stored directly
+        self._kinds.append(token_type)
+        self._starts.append(start)
+        self._ends.append(end)
+
+    def __len__(self):
+        return len(self._kinds)
+
+    def __getitem__(self, index):
+        return (
+            _TOKEN_TYPES_BY_VALUE[self._kinds[index]],
+            self._starts[index],
+            self.token_value(index)
+        )
+
+    def __iter__(self):
+        for index in range(len(self._kinds)):
+            yield self[index]
+
+    def token_type(self, index):
+        return _TOKEN_TYPES_BY_VALUE[self._kinds[index]]
+
+    def token_value(self, index):
+        """Slices value of token from source. Values sliced from bytes-like source are decoded into str"""
+        kind = self._kinds[index]
+        start = self._starts[index]
+        end = self._ends[index]
+
+        if kind == _INTEGER_KIND:
+            try:
+                return int(self._source[start:end])
+            except ValueError:
+                raise TokenizerError(
+                    self.get_line_index().position_of(start), _INTEGER_TOO_LONG.format(end - start)
+                ) from None
+
+        if kind == _STRING_KIND:
+            # strip enclosing quotation marks
+            value = self._source[start + 1:end - 1]
+
+            return value if self._is_text else value.decode("utf-8")
+
+        value = self._source[start:end]
+
+        # everything except strings is ASCII
+        return value if self._is_text else value.decode("ascii")
+
+    def get_line_index(self):
+        if self._line_index is None:
+            self._line_index = SourceLineIndex(self._source)
+
+        return self._line_index
+
+    def count_token_types(self):
+        """Returns dictionary of token counts by type"""
+        return {token_type: self._kinds.count(token_type.value) for token_type in TokenTypes}
+
+    def peek_token(self):
+        token = self._current_token
+
+        if token is None:
+            token = self._current_token = self[self._index]
+
+        return token
+
+    def pull_token(self):
+        """Returns token and moves index forward"""
+        token = self.peek_token()
+
+        self._index += 1
+        self._current_token = None
+
+        return token
+
+
 class Tokenizer:
-    def __init__(self):
+    def __init__(self, engine=TokenizerEngines.CHARACTER, collapse_whitespace=False):
+        """
+        When collapse_whitespace is set, each run of whitespace characters becomes single WHITESPACE token
+        (with whole run as its value) instead of one token per character
+        """
+        self._engine = engine
+        self._collapse_whitespace = collapse_whitespace
+
         self._source = None
         self._source_index = None
 
+        # source offset where currently scanned token begins
+        self._token_start = None
+
+        self._line_index = None
+
         self._tokens = None
 
-    def _add_token(self, token_type, token_value):
-        self._tokens.append((
+    def _reset(self, source_code):
+        self._source = source_code
+        self._source_index = 0
+        self._token_start = 0
+        self._line_index = None
+
+    def _make_token(self, token_type, token_value):
+        return (
             token_type,
-            (0, 0), # TODO: Implement actual source position counting
+            self._token_start,
             token_value
-
-        ))
+        )
 
     def _check_next_match(self, predicate):
         if self._source_index >= len(self._source):
@@ -70,58 +391,168 @@ class Tokenizer:
 
         return self._source[prev_index]
 
-    def _raise_tokenizer_error(self, message):
-        # calculate location
-        line = line_pos = 0
+    def get_line_index(self):
+        """Returns line index of last tokenized source, it is built on first request"""
+        if self._line_index is None:
+            self._line_index = SourceLineIndex(self._source)
 
-        for local_index in range(self._source_index - 1):
-            char = self._source[local_index]
+        return self._line_index
 
-            if char == "\n":
-                line_pos = 0
-                line += 1
-                return
+    def _raise_tokenizer_error(self, message, offset):
+        raise TokenizerError(self.get_line_index().position_of(offset), message)
 
-            line_pos += 1
-
-        raise TokenizerError((line, line_pos), message)
+    def _convert_integer(self, text, offset):
+        try:
+            return int(text)
+        except ValueError:
+            self._raise_tokenizer_error(_INTEGER_TOO_LONG.format(len(text)), offset)
 
     def tokenize(self, source_code):
-        self._source = source_code
-        self._source_index = 0
-        self._tokens = []
+        self._tokens = list(self.iter_tokens(source_code))
+
+        return self._tokens
+
+    def tokenize_to_buffer(self, source_code):
+        """
+        Tokenizes source into compact TokenBuffer. Always uses regex engine, since it works with whole runs.
+
+        Source can also be UTF-8 encoded bytes-like object (bytes, mmap - see map_source_file), which is scanned
+        without decoding it as whole. Only values of tokens are decoded, when they are requested.
+        Offsets (and columns in errors) are then counted in bytes
+        """
+        self._reset(source_code)
+
+        if isinstance(source_code, str):
+            master_pattern = _MASTER_PATTERN
+            quotation_mark = '"'
+        else:
+            master_pattern = _MASTER_PATTERN_BYTES
+            quotation_mark = b'"'
+
+        token_buffer = TokenBuffer(source_code)
+        add_token = token_buffer.add_token
+        token_groups = _MASTER_PATTERN_GROUPS
 
+        whitespace_type = TokenTypes.WHITESPACE
+        string_type = TokenTypes.STRING
+
+        collapse_whitespace = self._collapse_whitespace
+
+        for match in master_pattern.finditer(source_code):
+            token_type = token_groups[match.lastindex]
+            start, end = match.span()
+
+            if token_type is whitespace_type and not collapse_whitespace:
+                # every whitespace character is token of its own
+                for index in range(start, end):
+                    add_token(whitespace_type, index, index + 1)
+
+            elif token_type is string_type and (end - start < 2 or source_code[end - 1:end] != quotation_mark):
+                # ending '"' was not found
+                self._raise_tokenizer_error(r'String enclosing quotation marks not found.', start)
+
+            elif token_type is None:
+                self._raise_tokenizer_error("Unexpected character '{}'".format(_describe_character(match)), start)
+
+            else:
+                add_token(token_type, start, end)
+
+        self._source_index = len(source_code)
+        add_token(TokenTypes.EOF, len(source_code), len(source_code))
+
+        # tokenizer already knows line index of this source, share it
+        token_buffer._line_index = self._line_index
+
+        return token_buffer
+
+    def iter_tokens(self, source_code):
+        """Yields tokens one by one as they are scanned, last token is always EOF"""
+        self._reset(source_code)
+
+        if self._engine is TokenizerEngines.REGEX:
+            yield from self._scan_regex()
+        else:
+            yield from self._scan_characters()
+
+        self._token_start = len(source_code)
+        yield self._make_token(TokenTypes.EOF, "")
+
+    def _scan_regex(self):
+        source = self._source
+        token_groups = _MASTER_PATTERN_GROUPS
+
+        whitespace_type = TokenTypes.WHITESPACE
+        integer_type = TokenTypes.INTEGER
+        string_type = TokenTypes.STRING
+
+        collapse_whitespace = self._collapse_whitespace
+
+        for match in _MASTER_PATTERN.finditer(source):
+            token_type = token_groups[match.lastindex]
+            text = match.group()
+            start = match.start()
+
+            if token_type is whitespace_type:
+                if collapse_whitespace:
+                    yield (whitespace_type, start, text)
+                    continue
+
+                # every whitespace character is token of its own
+                for char in text:
+                    yield (whitespace_type, start, char)
+                    start += 1
+
+            elif token_type is integer_type:
+                yield (integer_type, start, self._convert_integer(text, start))
+
+            elif token_type is string_type:
+                if len(text) < 2 or text[-1] != '"':
+                    # ending '"' was not found
+                    self._raise_tokenizer_error(r'String enclosing quotation marks not found.', start)
+
+                yield (string_type, start, text[1:-1])
+
+            elif token_type is None:
+                self._raise_tokenizer_error("Unexpected character '{}'".format(text), start)
+
+            else:
+                yield (token_type, start, text)
+
+        self._source_index = len(source)
+
+    def _scan_characters(self):
         while self._source_index < len(self._source):
+            self._token_start = self._source_index
             character = self._get_char_and_advance()
 
             match character:
                 case ":":
-                    self._add_token(TokenTypes.COLON, character)
+                    yield self._make_token(TokenTypes.COLON, character)
 
                 case ",":
-                    self._add_token(TokenTypes.COMMA, character)
+                    yield self._make_token(TokenTypes.COMMA, character)
 
                 case ";":
                     if self._check_next_match(lambda char: char in (")", "]", "}")):
                         bracket = self._get_char_and_advance()
 
-                        self._add_token(TokenTypes.OBJECT_BRACKET_CLOSE, character + bracket)
+                        yield self._make_token(TokenTypes.OBJECT_BRACKET_CLOSE, character + bracket)
 
 
                     else:
-                        self._add_token(TokenTypes.SEMICOLON, character)
+                        yield self._make_token(TokenTypes.SEMICOLON, character)
 
                 case "(" | "[" | "{":
                     if self._check_next_match(lambda char: char == ";"):
                         semicolon = self._get_char_and_advance()
 
-                        self._add_token(TokenTypes.OBJECT_BRACKET_OPEN, character + semicolon)
+                        yield self._make_token(TokenTypes.OBJECT_BRACKET_OPEN, character + semicolon)
 
                     else:
-                        self._add_token(TokenTypes.BRACKET_OPEN, character)
+                        yield self._make_token(TokenTypes.BRACKET_OPEN, character)
 
                 case ")" | "]" | "}":
-                    self._add_token(TokenTypes.BRACKET_CLOSE, character)
+                    yield self._make_token(TokenTypes.BRACKET_CLOSE, character)
 
                 case '"':
                     token_string = ""
@@ -135,12 +566,18 @@ class Tokenizer:
                         token_string += next_character
                     else:
                         # ending '"' was not found
-                        self._raise_tokenizer_error(r'String enclosing quotation marks not found.')
+                        self._raise_tokenizer_error(r'String enclosing quotation marks not found.', self._token_start)
 
-                    self._add_token(TokenTypes.STRING, token_string)
+                    yield self._make_token(TokenTypes.STRING, token_string)
 
                 case " " | "\t" | "\n" | "\r":
-                    self._add_token(TokenTypes.WHITESPACE, character)
+                    whitespace_text = character
+
+                    if self._collapse_whitespace:
+                        while self._check_next_match(lambda char: char in " \t\n\r"):
+                            whitespace_text += self._get_char_and_advance()
+
+                    yield self._make_token(TokenTypes.WHITESPACE, whitespace_text)
 
 
                 case x if x in "0123456789":
@@ -150,9 +587,9 @@ class Tokenizer:
                         token_number += self._get_char_and_advance()
 
                     # TODO: implement handling of decimals
-                    self._add_token(
+                    yield self._make_token(
                         TokenTypes.INTEGER,
-                        int(token_number)
+                        self._convert_integer(token_number, self._token_start)
                     )
 
                 # handle operator symbols
@@ -162,7 +599,7 @@ class Tokenizer:
                     while self._check_next_match(lambda char: char in OPERATOR_CHARACTERS):
                         operator_text += self._get_char_and_advance()
 
-                    self._add_token(
+                    yield self._make_token(
                         TokenTypes.OPERATOR_SYMBOL,
                         operator_text
                     )
@@ -174,7 +611,7 @@ class Tokenizer:
                     while self._check_next_match(lambda char: char in KEYWORD_CHARACTERS):
                         keyword_text += self._get_char_and_advance()
 
-                    self._add_token(
+                    yield self._make_token(
                         TokenTypes.KEYWORD_SYMBOL,
                         keyword_text
                     )
@@ -182,10 +619,5 @@ class Tokenizer:
 
 
                 case unknown_char:
-                    self._raise_tokenizer_error("Unexpected character '{}'".format(unknown_char))
-
-
-        self._add_token(TokenTypes.EOF, "")
-
-        return self._tokens
+                    self._raise_tokenizer_error("Unexpected character '{}'".format(unknown_char), self._token_start)
 
@@ -0,0 +1,38 @@
+import pytest
+
+from source.benchmarks.corpus import CorpusShape, generate_corpus
+from source.compiler.arena import from_tree
+from source.compiler.parsing import IterativeParser, Parser
+from source.compiler.serialization import get_module_bytes
+from source.compiler.tokenization import Tokenizer
+
+
+DEPTH = 5000
+
+
+def _parse(source_code):
+    return IterativeParser(Tokenizer().tokenize(source_code)).parse_root_code()
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_arena_compiles_like_linked_nodes(seed):
+    root_code = Parser(Tokenizer().tokenize(generate_corpus(CorpusShape(expression_count=200), seed))).parse_root_code()
+    tree = from_tree(root_code)
+
+    # arena stands in for CodeBox wherever root code is written
+    assert get_module_bytes(tree) == get_module_bytes(root_code)
+    assert from_tree(tree.to_tree()).get_compiled() == tree.get_compiled()
+
+
+@pytest.mark.parametrize("source_code", [
+    # receivers nested in receivers
+    "a" + ":b" * DEPTH + ",",
+    # operator arguments nested in arguments
+    "1" + " + 1" * DEPTH + ",",
+    # message arguments nested in arguments
+    "a(" * DEPTH + "1" + ")" * DEPTH + ",",
+], ids=["send_chain", "operator_chain", "nested_arguments"])
+def test_deep_trees_do_not_hit_recursion_limit(source_code):
+    tree = from_tree(_parse(source_code))
+
+    assert from_tree(tree.to_tree()).get_compiled() == tree.get_compiled()
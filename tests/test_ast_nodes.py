@@ -0,0 +1,132 @@
+import pytest
+
+from source.benchmarks.corpus import CorpusShape, generate_corpus
+from source.compiler import ast_nodes
+from source.compiler.ast_nodes import CodeContext, ObjectBox, clear_literal_cache, encode_string, encode_symbol, \
+    literal_cache_info
+from source.compiler.bytecodes import BytecodeVerificationError, LiteralTags, Opcodes, iter_instructions
+from source.compiler.compilation import compile_source
+from source.compiler.parsing import Parser
+from source.compiler.serialization import DecodedObject, read_module_bytes
+from source.compiler.tokenization import Tokenizer
+
+
+def _compile_into_context(source_code):
+    """Compiles expressions of source into fresh code context, which is left unfinished"""
+    code_context = CodeContext()
+
+    for expression in Parser(Tokenizer().tokenize(source_code)).parse_root_code().get_value():
+        expression.compile(code_context)
+
+    return code_context
+
+
+def _literal_parameters(root_code):
+    return [
+        parameter for _, opcode, parameter in iter_instructions(root_code.bytecode) if opcode == Opcodes.PUSH_LITERAL
+    ]
+
+
+def test_duplicate_literals_share_pool_entry():
+    source_code = "p(1) + p(1) + p(1),"
+
+    # two more 1 and two more p: symbols, one more +: symbol
+    assert _compile_into_context(source_code).get_deduplicated_count() == 5
+
+    root_code = read_module_bytes(compile_source(source_code))
+
+    assert len(root_code.literals) == 3
+    assert set(_literal_parameters(root_code)) == {root_code.literals.index(1)}
+
+
+def test_object_literals_are_never_interned():
+    source_code = "p((; ;;)), p((; ;;)),"
+
+    # only p: symbol is shared
+    assert _compile_into_context(source_code).get_deduplicated_count() == 1
+
+    root_code = read_module_bytes(compile_source(source_code))
+    object_parameters = _literal_parameters(root_code)
+
+    assert len(set(object_parameters)) == 2
+    assert all(isinstance(root_code.literals[parameter], DecodedObject) for parameter in object_parameters)
+
+    code_context = CodeContext()
+    assert code_context.add_literal(ObjectBox([], None)) != code_context.add_literal(ObjectBox([], None))
+    assert code_context.get_deduplicated_count() == 0
+
+
+@pytest.fixture
+def empty_literal_cache():
+    clear_literal_cache()
+    yield
+    clear_literal_cache()
+
+
+def test_literal_encodings_are_shared_between_code_contexts(empty_literal_cache):
+    source_code = "a:b(1, \"text\"),"
+
+    compile_source(source_code)
+    first = literal_cache_info()
+
+    # separate compilation, so separate code contexts
+    compile_source(source_code)
+    second = literal_cache_info()
+
+    for kind in ("symbol", "integer", "string"):
+        assert second[kind].hits > first[kind].hits
+        assert second[kind].misses == first[kind].misses
+
+
+@pytest.mark.parametrize("length, is_cached", [(256, True), (257, False), (5000, False)])
+def test_long_texts_bypass_cache(empty_literal_cache, length, is_cached):
+    text = "a" * length
+
+    assert encode_string(text) == encode_string(text)
+    assert encode_symbol(1, text) == encode_symbol(1, text)
+
+    cache_info = literal_cache_info()
+    assert cache_info["string"].currsize == cache_info["symbol"].currsize == (1 if is_cached else 0)
+
+    assert encode_string(text) == bytes((LiteralTags.VM_STRING,)) + length.to_bytes(8, "big") + text.encode("utf-8")
+
+
+def test_output_is_same_after_clearing_cache(empty_literal_cache):
+    source_code = generate_corpus(CorpusShape(expression_count=100, string_length=400), 0)
+
+    cached = compile_source(source_code, optimize=True)
+    assert sum(cache_info.currsize for cache_info in literal_cache_info().values()) > 0
+
+    clear_literal_cache()
+    assert sum(cache_info.currsize for cache_info in literal_cache_info().values()) == 0
+
+    assert compile_source(source_code, optimize=True) == cached
+
+
+@pytest.mark.parametrize("source_code", [
+    "a:b(1, 2, 3) + c:d(4, 5),",
+    generate_corpus(CorpusShape(expression_count=100), 0),
+], ids=["sends", "corpus"])
+def test_verify_accepts_tracked_stack_usage(source_code):
+    code_context = _compile_into_context(source_code)
+
+    code_context.verify()
+
+
+def test_verify_rejects_stack_underflow():
+    code_context = CodeContext()
+    code_context.add_instruction(Opcodes.PULL, 0x00)
+
+    with pytest.raises(BytecodeVerificationError):
+        code_context.verify()
+
+
+def test_verify_rejects_wrong_tracked_usage(monkeypatch):
+    code_context = _compile_into_context("a:b(1, 2),")
+    tracked_usage = code_context.get_stack_usage()
+
+    # bytecode which needs one more stack slot than context tracked
+    monkeypatch.setattr(ast_nodes, "measure_stack_depth", lambda bytecode, selector_arities: tracked_usage + 1)
+
+    with pytest.raises(BytecodeVerificationError, match="does not match"):
+        code_context.verify()
@@ -0,0 +1,73 @@
+import pytest
+
+from source.benchmarks.corpus import CorpusShape, generate_corpus
+from source.compiler.bytecodes import BytecodeVerificationError, Opcodes, encode_instruction, iter_instructions, \
+    measure_stack_depth
+from source.compiler.compilation import compile_source
+from source.compiler.serialization import DecodedCode, DecodedObject, DecodedSymbol, read_module_bytes
+
+
+@pytest.mark.parametrize("parameter", [0, 1, 255, 256, 0xFFFF, 0x10000, 0x123456789])
+def test_instruction_parameters_round_trip(parameter):
+    encoded = encode_instruction(Opcodes.PUSH_LITERAL, parameter)
+
+    assert list(iter_instructions(encoded)) == [(0, Opcodes.PUSH_LITERAL, parameter)]
+
+
+def test_small_parameters_use_compact_form():
+    assert encode_instruction(Opcodes.SEND, 255) == bytes((Opcodes.SEND, 255))
+    assert encode_instruction(Opcodes.SEND, 256) == bytes((Opcodes.EXTENDED_ARG, 1, Opcodes.SEND, 0))
+
+
+def test_rejects_unfinished_instruction():
+    with pytest.raises(ValueError):
+        list(iter_instructions(bytes((Opcodes.EXTENDED_ARG, 1))))
+
+    with pytest.raises(ValueError):
+        list(iter_instructions(bytes((Opcodes.PULL,))))
+
+
+def test_method_with_many_literals_round_trips():
+    source = "".join("{},".format(index) for index in range(1000))
+
+    root_code = read_module_bytes(compile_source(source))
+
+    assert root_code.literals == list(range(1000))
+    assert [parameter for _, opcode, parameter in iter_instructions(root_code.bytecode)
+            if opcode == Opcodes.PUSH_LITERAL] == list(range(1000))
+
+
+def _iter_codes(code):
+    """Yields code and all codes nested in its literals"""
+    yield code
+
+    for literal in code.literals:
+        if isinstance(literal, DecodedCode):
+            yield from _iter_codes(literal)
+        elif isinstance(literal, DecodedObject) and literal.code is not None:
+            yield from _iter_codes(literal.code)
+
+
+def _selector_arities(code):
+    return {index: literal.arity for index, literal in enumerate(code.literals) if isinstance(literal, DecodedSymbol)}
+
+
+def test_stack_usage_is_exact_maximum():
+    assert read_module_bytes(compile_source("a:b(1, 2, 3) + c:d(4, 5),")).stack_usage == 4
+
+
+def test_declared_stack_usage_matches_bytecode():
+    shape = CorpusShape(expression_count=10, nesting_depth=4, send_chain_length=4, slot_count=3, string_length=4)
+
+    for seed in range(50):
+        for code in _iter_codes(read_module_bytes(compile_source(generate_corpus(shape, seed)))):
+            assert code.stack_usage == measure_stack_depth(code.bytecode, _selector_arities(code))
+
+
+@pytest.mark.parametrize("bytecode, selector_arities", [
+    (bytes((Opcodes.PULL, 0)), {}),
+    (bytes((Opcodes.PUSH_MYSELF, 0, Opcodes.SEND, 0)), {0: 1}),
+])
+def test_verification_rejects_stack_underflow(bytecode, selector_arities):
+    with pytest.raises(BytecodeVerificationError):
+        measure_stack_depth(bytecode, selector_arities)
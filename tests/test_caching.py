@@ -0,0 +1,137 @@
+import os
+
+import pytest
+
+from source.compiler import caching
+from source.compiler.caching import CompilationCache
+from source.compiler.compilation import compile_source
+from source.compiler.driver import main
+
+
+SOURCES = ["a,", "b,", "c,", "d,"]
+
+
+def _entry_names(directory):
+    return sorted(os.listdir(directory))
+
+
+def _set_age(directory, key, seconds_ago):
+    entry_path = os.path.join(directory, key + ".ore")
+    modification_time = os.stat(entry_path).st_mtime_ns - seconds_ago * 1_000_000_000
+
+    os.utime(entry_path, ns=(modification_time, modification_time))
+
+
+def test_hits_and_misses_are_counted(tmp_path):
+    cache = CompilationCache(str(tmp_path))
+
+    assert cache.compile("a:b(1),") == compile_source("a:b(1),")
+    assert cache.compile("a:b(1),") == compile_source("a:b(1),")
+    cache.compile("a:b(1),", optimize=True)
+
+    statistics = cache.get_statistics()
+    assert (statistics["hits"], statistics["misses"], statistics["evictions"]) == (1, 2, 0)
+    assert statistics["size_bytes"] == len(compile_source("a:b(1),")) + len(compile_source("a:b(1),", optimize=True))
+
+
+def test_key_depends_on_options_and_compiler_version(tmp_path, monkeypatch):
+    cache = CompilationCache(str(tmp_path))
+
+    keys = {
+        cache.get_key("a,"),
+        cache.get_key("a,", optimize=True),
+        cache.get_key("a,", fold_constants=True),
+        cache.get_key("a,", optimize=True, fold_constants=True),
+        cache.get_key("b,"),
+    }
+    assert len(keys) == 5
+    assert cache.get_key("a,") == CompilationCache(str(tmp_path)).get_key("a,")
+
+    key = cache.get_key("a,")
+    monkeypatch.setattr(caching, "COMPILER_VERSION_TAG", caching.COMPILER_VERSION_TAG + "-changed")
+    assert cache.get_key("a,") != key
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    entry_size = len(compile_source(SOURCES[0]))
+    cache = CompilationCache(str(tmp_path), max_size_bytes=3 * entry_size)
+
+    for age, source_code in zip((30, 20, 10), SOURCES[:3]):
+        cache.compile(source_code)
+        _set_age(str(tmp_path), cache.get_key(source_code), age)
+
+    # oldest entry is used again, so the second oldest becomes least recently used
+    cache.compile(SOURCES[0])
+    cache.compile(SOURCES[3])
+
+    assert cache.get_statistics()["evictions"] == 1
+    assert _entry_names(str(tmp_path)) == sorted(
+        cache.get_key(source_code) + ".ore" for source_code in (SOURCES[0], SOURCES[2], SOURCES[3])
+    )
+
+
+def test_size_is_recounted_when_directory_is_reopened(tmp_path):
+    cache = CompilationCache(str(tmp_path))
+
+    for source_code in SOURCES:
+        cache.compile(source_code)
+
+    reopened = CompilationCache(str(tmp_path))
+    assert reopened.get_statistics()["size_bytes"] == cache.get_statistics()["size_bytes"]
+
+    reopened.clear()
+    assert _entry_names(str(tmp_path)) == []
+    assert CompilationCache(str(tmp_path)).get_statistics()["size_bytes"] == 0
+
+
+def test_entry_is_written_through_temporary_file(tmp_path, monkeypatch):
+    cache = CompilationCache(str(tmp_path))
+    cache.compile("a,")
+
+    assert _entry_names(str(tmp_path)) == [cache.get_key("a,") + ".ore"]
+
+    def fail(source_path, destination_path):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+
+    with pytest.raises(OSError):
+        cache.compile("b,")
+
+    # failed write leaves neither entry nor temporary file behind
+    assert _entry_names(str(tmp_path)) == [cache.get_key("a,") + ".ore"]
+
+
+def test_driver_compiles_through_cache(tmp_path, monkeypatch):
+    source_directory = tmp_path / "in"
+    source_directory.mkdir()
+
+    for index, source_code in enumerate(SOURCES):
+        (source_directory / "{}.src".format(index)).write_text(source_code)
+
+    cache_directory = tmp_path / "cache"
+
+    def run_driver(output_name):
+        output_directory = str(tmp_path / output_name)
+
+        return main([str(source_directory), output_directory, "--workers", "1", "--cache", str(cache_directory)])
+
+    assert run_driver("first") == 0
+
+    def fail(*arguments):
+        raise AssertionError("cached source compiled again")
+
+    # second build is served from cache only
+    monkeypatch.setattr(caching, "compile_source", fail)
+    assert run_driver("second") == 0
+
+    # build without --cache does not go through cache of previous build
+    (source_directory / "new.src").write_text("e,")
+    assert main([str(source_directory), str(tmp_path / "uncached"), "--workers", "1"]) == 0
+
+    cache = CompilationCache(str(cache_directory))
+    assert _entry_names(str(cache_directory)) == sorted(cache.get_key(source_code) + ".ore" for source_code in SOURCES)
+
+    for index, source_code in enumerate(SOURCES):
+        for output_name in ("first", "second"):
+            assert (tmp_path / output_name / "{}.ore".format(index)).read_bytes() == compile_source(source_code)
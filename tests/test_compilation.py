@@ -0,0 +1,116 @@
+import pytest
+
+from source.benchmarks.corpus import CorpusShape, generate_corpus
+from source.compiler.arena import from_tree
+from source.compiler.compilation import BatchCompiler, compile_batch, compile_mapped_file, compile_source
+from source.compiler.parsing import IterativeParser, Parser, ParserError
+from source.compiler.serialization import get_module_bytes
+from source.compiler.tokenization import SourceLineIndex, Tokenizer, TokenizerError
+
+
+def test_batch_matches_single_compilation():
+    sources = ["a:b(1, 2),", "(; x(0) = 1, ;;),", "foo(\"text\"), 1 + 2,"]
+
+    results = compile_batch(sources, optimize=True)
+
+    assert [result.module_bytes for result in results] == [compile_source(source, True) for source in sources]
+    assert all(result.error is None for result in results)
+
+
+def test_batch_isolates_errors():
+    results = compile_batch(["a,", "1" * 5000 + ",", "b(,", "c,"])
+
+    assert [result.error is None for result in results] == [True, False, False, True]
+    assert isinstance(results[1].error, TokenizerError)
+    assert results[3].module_bytes == compile_source("c,")
+
+
+@pytest.mark.parametrize("source", ["1" * 5000 + ",", "a,\n" + " " * 5000 + "1" * 5000 + ","])
+def test_too_long_integer_is_tokenizer_error(source):
+    # long sources go through TokenBuffer, which converts integers only when parser asks for them
+    with pytest.raises(TokenizerError) as error_info:
+        BatchCompiler().compile(source)
+
+    position, _ = error_info.value.args
+    assert position == ((0, 0) if source[0] == "1" else (1, 5000))
+
+
+@pytest.mark.parametrize("padding", [0, 5000])
+def test_parser_error_reports_line_and_column(padding):
+    # padded source is longer than SMALL_SOURCE_LENGTH, so it goes through TokenBuffer
+    source = "a,\n" + " " * padding + "b:c(1,\n  2"
+
+    with pytest.raises(ParserError) as error_info:
+        BatchCompiler().compile(source)
+
+    assert error_info.value.get_position() == (2, 3)
+
+
+def test_line_index_is_not_built_without_error(monkeypatch):
+    def fail(self, source):
+        raise AssertionError("line index built")
+
+    monkeypatch.setattr(SourceLineIndex, "__init__", fail)
+
+    for source in ("a,\nb,", "a,\n" * 5000 + "b,"):
+        BatchCompiler().compile(source)
+
+
+DEEP_SOURCES = {
+    "send_chain": "a" + ":b" * 5000 + ",",
+    "operator_chain": "1" + " + 1" * 5000 + ",",
+    "nested_arguments": "a(" * 5000 + "1" + ")" * 5000 + ",",
+}
+
+
+@pytest.mark.parametrize("source", DEEP_SOURCES.values(), ids=DEEP_SOURCES.keys())
+def test_deep_sources_compile_with_iterative_parser(source):
+    module_bytes = compile_source(source, parser_class=IterativeParser)
+
+    # arena compiler never recursed, so it is reference for linked emission
+    root_code = IterativeParser(Tokenizer().tokenize(source)).parse_root_code()
+    assert module_bytes == get_module_bytes(from_tree(root_code))
+
+    assert compile_source(source, optimize=True, fold_constants=True, parser_class=IterativeParser)
+
+
+def test_send_chain_does_not_need_iterative_parser():
+    # sends of chain are parsed in loop, so only emission and folding could recurse
+    source = DEEP_SOURCES["send_chain"]
+
+    assert compile_source(source, fold_constants=True) == compile_source(source, parser_class=IterativeParser)
+
+
+def test_deep_operator_chain_is_folded():
+    source = "1" + " + 1" * 5000 + ","
+
+    assert compile_source(source, fold_constants=True, parser_class=IterativeParser) == compile_source("5001,")
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+@pytest.mark.parametrize("fold_constants", [False, True])
+def test_parsers_compile_same_modules(optimize, fold_constants):
+    sources = [generate_corpus(CorpusShape(expression_count=100), seed) for seed in range(3)]
+
+    assert compile_batch(sources, optimize, fold_constants, IterativeParser) == \
+        compile_batch(sources, optimize, fold_constants, Parser)
+
+
+@pytest.mark.parametrize("source", [
+    "",
+    "a:b(\"zažltlý kôň\"),",
+    generate_corpus(CorpusShape(expression_count=200), 0),
+], ids=["empty", "non_ascii", "corpus"])
+def test_mapped_file_compiles_like_text(tmp_path, source):
+    source_path = tmp_path / "source.src"
+    source_path.write_bytes(source.encode("utf-8"))
+
+    assert compile_mapped_file(str(source_path), optimize=True) == compile_source(source, optimize=True)
+
+
+def test_invalid_utf8_in_mapped_file(tmp_path):
+    source_path = tmp_path / "source.src"
+    source_path.write_bytes(b"a,\nb(\"\xff\xfe\"),")
+
+    with pytest.raises(UnicodeDecodeError):
+        compile_mapped_file(str(source_path))
@@ -0,0 +1,98 @@
+import os
+
+from source.compiler import driver
+from source.compiler.compilation import compile_mapped_file, compile_source
+from source.compiler.driver import compile_tree, main
+
+
+def _write_sources(directory, sources):
+    for name, source_code in sources.items():
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source_code)
+
+
+SOURCES = {
+    "a.src": "a:b(1),",
+    "nested/b.src": "1" * 5000 + ",",
+    "nested/c.src": "c(\"text\"),",
+    "d.src": "d(,",
+}
+
+
+def test_errors_are_collected_per_file(tmp_path):
+    _write_sources(tmp_path / "in", SOURCES)
+
+    results = compile_tree(str(tmp_path / "in"), str(tmp_path / "out"), workers=1)
+
+    assert [os.path.relpath(result.source_path, tmp_path / "in") for result in results] == \
+        ["a.src", "d.src", os.path.join("nested", "b.src"), os.path.join("nested", "c.src")]
+    assert [result.error is None for result in results] == [True, False, False, True]
+    assert results[2].error.startswith("TokenizerError")
+
+    assert (tmp_path / "out" / "nested" / "c.ore").read_bytes() == compile_source(SOURCES["nested/c.src"])
+    assert not (tmp_path / "out" / "nested" / "b.ore").exists()
+
+
+def test_process_pool_gives_same_results(tmp_path):
+    _write_sources(tmp_path / "in", SOURCES)
+
+    serial = compile_tree(str(tmp_path / "in"), str(tmp_path / "serial"), workers=1)
+    parallel = compile_tree(str(tmp_path / "in"), str(tmp_path / "parallel"), workers=2)
+
+    assert serial == parallel
+
+
+def test_main_reports_failed_files(tmp_path, capsys):
+    _write_sources(tmp_path / "in", SOURCES)
+
+    assert main([str(tmp_path / "in"), str(tmp_path / "out"), "--workers", "1"]) == 1
+
+    captured = capsys.readouterr()
+    assert "compiled 2 of 4 sources" in captured.out
+    assert "b.src: TokenizerError" in captured.err
+
+
+def test_main_parser_option(tmp_path, capsys):
+    # too deeply nested for recursive parser
+    _write_sources(tmp_path / "in", {"deep.src": "a" + "(1 +" * 5000 + " 1" + ")" * 5000 + ","})
+
+    assert main([str(tmp_path / "in"), str(tmp_path / "recursive"), "--workers", "1"]) == 1
+    assert "deep.src: RecursionError" in capsys.readouterr().err
+
+    assert main([str(tmp_path / "in"), str(tmp_path / "iterative"), "--workers", "1", "--parser", "iterative"]) == 0
+    assert (tmp_path / "iterative" / "deep.ore").exists()
+
+
+def test_big_files_are_memory_mapped(tmp_path, monkeypatch):
+    sources = dict(SOURCES, **{"empty.src": "", "utf8.src": "a(\"kôň\"),"})
+    _write_sources(tmp_path / "in", sources)
+    (tmp_path / "in" / "invalid.src").write_bytes(b"b(\"\xff\"),")
+
+    mapped_paths = []
+
+    def compile_mapped(source_path, *arguments):
+        mapped_paths.append(source_path)
+        return compile_mapped_file(source_path, *arguments)
+
+    # every file, even empty one, is over the limit
+    monkeypatch.setattr(driver, "MAPPED_SOURCE_SIZE", -1)
+    monkeypatch.setattr(driver, "compile_mapped_file", compile_mapped)
+
+    results = {
+        os.path.relpath(result.source_path, tmp_path / "in"): result
+        for result in compile_tree(str(tmp_path / "in"), str(tmp_path / "out"), workers=1)
+    }
+
+    assert len(mapped_paths) == len(results) == len(sources) + 1
+
+    for name, source_code in sources.items():
+        result = results[os.path.normpath(name)]
+
+        if result.error is None:
+            assert result.module_bytes == compile_source(source_code)
+
+    assert results["empty.src"].module_bytes == compile_source("")
+    assert results["utf8.src"].module_bytes is not None
+    assert results["invalid.src"].error.startswith("UnicodeDecodeError")
+    assert results[os.path.join("nested", "b.src")].error.startswith("TokenizerError")
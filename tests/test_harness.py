@@ -0,0 +1,46 @@
+from source.benchmarks.corpus import CorpusShape, generate_corpus
+from source.benchmarks.harness import BenchmarkRunner, compare_results, format_results, main
+from source.compiler.parsing import IterativeParser
+
+
+def _small_runner(**options):
+    return BenchmarkRunner(generate_corpus(CorpusShape(expression_count=20), 0), repeat=1, **options)
+
+
+def test_every_stage_is_measured():
+    runner = _small_runner()
+    results = runner.run()
+
+    assert list(results["stages"]) == runner.get_stage_names()
+    assert {"tokenize", "tokenize_character", "parse", "parse_collapsed"} <= set(runner.get_stage_names())
+
+    for stage in results["stages"].values():
+        assert stage["best_seconds"] > 0
+        assert stage["retained_bytes_per_node"] >= 0
+
+    assert len(format_results(results).splitlines()) == len(results["stages"]) + 1
+
+
+def test_selected_stages_only():
+    results = _small_runner(parser_class=IterativeParser).run(["tokenize_character", "parse_collapsed"])
+
+    assert list(results["stages"]) == ["tokenize_character", "parse_collapsed"]
+
+
+def test_slower_stage_is_regression():
+    baseline = {"stages": {"parse": {"best_seconds": 1.0}, "emit": {"best_seconds": 1.0}}}
+    current = {"stages": {"parse": {"best_seconds": 1.2}, "emit": {"best_seconds": 1.01}, "new": {"best_seconds": 1}}}
+
+    assert [(name, is_regression) for name, *_, is_regression in compare_results(baseline, current)] == \
+        [("parse", True), ("emit", False)]
+
+
+def test_main_fails_on_regression(tmp_path, capsys):
+    arguments = ["--expressions", "10", "--repeat", "1", "--stage", "parse_collapsed"]
+    baseline_path = tmp_path / "baseline.json"
+
+    assert main(arguments + ["--output", str(baseline_path)]) == 0
+
+    # every ratio is above zero threshold, so each stage counts as regression
+    assert main(arguments + ["--baseline", str(baseline_path), "--threshold", "0"]) == 1
+    assert "REGRESSION" in capsys.readouterr().out
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from source.benchmarks.corpus import CorpusShape, generate_corpus
+from source.compiler.compilation import COMPILATION_ERRORS, compile_source
+from source.compiler.incremental import IncrementalDocument
+from source.compiler.tokenization import Tokenizer, TokenizerEngines
+
+
+def _full_result(source_code):
+    """Returns module bytes of source, or type and arguments of error it cannot be compiled with"""
+    try:
+        return compile_source(source_code)
+    except COMPILATION_ERRORS as error:
+        return type(error), error.args
+
+
+def _incremental_result(document):
+    error = document.get_error()
+
+    if error is not None:
+        return type(error), error.args
+
+    return document.get_module_bytes()
+
+
+def test_document_compiles_like_whole_source():
+    source_code = "a:b(1),\n(; x(0) = 2, ; x, ;),\n\"text\","
+    document = IncrementalDocument(source_code)
+
+    assert document.get_segment_count() == 3
+    assert document.get_module_bytes(optimize=True) == compile_source(source_code, optimize=True)
+    assert document.get_tokens() == Tokenizer(TokenizerEngines.REGEX, collapse_whitespace=True).tokenize(source_code)
+
+
+def test_edit_reuses_untouched_segments():
+    document = IncrementalDocument("a:b(1),\nc:d(2),\ne:f(3),")
+    first_node, _, last_node = document.get_root_code().get_value()
+
+    document.edit(len("a:b(1),\nc:d("), 1, "42")
+
+    new_nodes = document.get_root_code().get_value()
+
+    assert new_nodes[0] is first_node and new_nodes[2] is last_node
+    assert document.get_module_bytes() == compile_source("a:b(1),\nc:d(42),\ne:f(3),")
+
+
+def test_broken_document_reports_position_in_whole_source():
+    document = IncrementalDocument("a,\nb,\nc,")
+
+    document.edit(len("a,\nb"), 0, " \"open")
+
+    error = document.get_error()
+    assert error.args == ((1, 2), "String enclosing quotation marks not found.")
+
+    document.edit(len("a,\nb"), len(" \"open"), "")
+
+    assert document.get_error() is None
+    assert document.get_module_bytes() == compile_source("a,\nb,\nc,")
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_random_edits_match_full_compilation(seed):
+    generator = random.Random(seed)
+    shape = CorpusShape(expression_count=30, nesting_depth=3, send_chain_length=3, slot_count=3, string_length=10)
+
+    source_code = generate_corpus(shape, seed)
+    document = IncrementalDocument(source_code)
+
+    for _ in range(1500):
+        offset = generator.randrange(len(source_code) + 1)
+        removed_length = generator.randrange(min(4, len(source_code) - offset) + 1)
+        inserted_text = "".join(generator.choice(",()\"; :+a1\n") for _ in range(generator.randrange(3)))
+
+        document.edit(offset, removed_length, inserted_text)
+        source_code = source_code[:offset] + inserted_text + source_code[offset + removed_length:]
+
+        assert document.get_text() == source_code
+        assert _incremental_result(document) == _full_result(source_code)
@@ -0,0 +1,33 @@
+import pytest
+
+from source.compiler.compilation import compile_source
+from source.compiler.serialization import read_module_bytes
+
+
+def _root_code(source_code, **options):
+    return read_module_bytes(compile_source(source_code, **options))
+
+
+def test_folds_constant_operators():
+    folded = _root_code("(2 + 3) * 4,", fold_constants=True)
+
+    assert folded.literals == [20]
+
+
+def test_keeps_sends_whose_result_does_not_fit():
+    source = "9223372036854775807 + 1,"
+
+    assert _root_code(source, fold_constants=True) == _root_code(source)
+
+
+@pytest.mark.parametrize("source", ["9223372036854775808 - 1,", "1 - 9223372036854775808,"])
+def test_folding_does_not_accept_out_of_range_operands(source):
+    for fold_constants in (False, True):
+        with pytest.raises(OverflowError):
+            compile_source(source, fold_constants=fold_constants)
+
+
+def test_optimizer_drops_unused_literals():
+    optimized = _root_code("\"unused\", 1, a:b(2),", optimize=True)
+
+    assert optimized.literals == _root_code("a:b(2),").literals
@@ -0,0 +1,92 @@
+import pytest
+
+from source.benchmarks.corpus import CorpusShape, generate_corpus
+from source.compiler.parsing import IterativeParser, Parser, ParserError
+from source.compiler.serialization import get_module_bytes
+from source.compiler.tokenization import Tokenizer, TokenizerEngines, TokenizerError, TokenStream, TokenTypes
+
+
+def _module_bytes(parser_class, source_code):
+    return get_module_bytes(parser_class(Tokenizer().tokenize(source_code)).parse_root_code())
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_parsers_build_same_trees(seed):
+    source_code = generate_corpus(CorpusShape(expression_count=200), seed)
+
+    assert _module_bytes(IterativeParser, source_code) == _module_bytes(Parser, source_code)
+
+
+@pytest.mark.parametrize("source_code", [
+    "a:b(1, \"x\"),",
+    "(; x(0) = 1, y(1) = (; ;;), ; x + 2, ;),",
+    "a + (b - c:d) * 3,",
+])
+def test_parsers_agree_on_hand_written_sources(source_code):
+    assert _module_bytes(IterativeParser, source_code) == _module_bytes(Parser, source_code)
+
+
+@pytest.mark.parametrize("source_code", ["a:b(1,", "(a,", "(; x = ;;),", "a:1,"])
+def test_parsers_report_same_errors(source_code):
+    errors = []
+
+    for parser_class in (Parser, IterativeParser):
+        with pytest.raises(ParserError) as error_info:
+            parser_class(Tokenizer().tokenize(source_code)).parse_root_code()
+
+        errors.append(error_info.value.args)
+
+    assert errors[0] == errors[1]
+
+
+def test_iterative_parser_handles_deep_nesting():
+    depth = 20000
+    source_code = "(" * depth + "1" + ")" * depth + ","
+
+    with pytest.raises(RecursionError):
+        Parser(Tokenizer().tokenize(source_code)).parse_root_code()
+
+    root_code = IterativeParser(Tokenizer().tokenize(source_code)).parse_root_code()
+    assert len(root_code.get_value()) == 1
+
+
+@pytest.mark.parametrize("engine", list(TokenizerEngines))
+@pytest.mark.parametrize("parser_class", [Parser, IterativeParser])
+def test_streamed_tokens_build_same_modules(engine, parser_class):
+    source_code = generate_corpus(CorpusShape(expression_count=200), 0)
+
+    streamed_root = parser_class(Tokenizer(engine).iter_tokens(source_code)).parse_root_code()
+
+    assert get_module_bytes(streamed_root) == _module_bytes(Parser, source_code)
+
+
+@pytest.mark.parametrize("engine", list(TokenizerEngines))
+def test_tokenizer_error_is_raised_mid_stream(engine):
+    source_code = "a:b(1),\nc + 2,\n\"unterminated,"
+
+    with pytest.raises(TokenizerError) as expected_error:
+        Tokenizer(engine).tokenize(source_code)
+
+    expressions = Parser(Tokenizer(engine).iter_tokens(source_code)).iter_root_expressions()
+
+    # expressions before error are parsed before scanner reaches it
+    assert next(expressions) is not None
+    assert next(expressions) is not None
+
+    with pytest.raises(TokenizerError) as streamed_error:
+        next(expressions)
+
+    assert streamed_error.value.args == expected_error.value.args
+
+
+def test_token_stream_lookahead_and_sticky_eof():
+    tokens = Tokenizer().tokenize("a b")
+    stream = TokenStream(iter(tokens))
+
+    assert stream.peek_token(2) == tokens[2]
+    assert [stream.pull_token() for _ in range(len(tokens))] == tokens
+
+    # exhausted stream keeps returning EOF
+    for _ in range(3):
+        assert stream.peek_token()[0] is TokenTypes.EOF
+        assert stream.pull_token() == tokens[-1]
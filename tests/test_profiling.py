@@ -0,0 +1,111 @@
+import io
+import json
+
+import pytest
+
+from source.compiler.caching import CompilationCache
+from source.compiler.compilation import compile_source
+from source.compiler.driver import main
+from source.compiler.profiling import CodeStatistics, CompileProfiler
+
+
+def _profile(source_code, **options):
+    profiler = CompileProfiler("test")
+    compile_source(source_code, profiler=profiler, **options)
+
+    return profiler
+
+
+@pytest.mark.parametrize("fold_constants, stages", [
+    (False, {"tokenize", "parse", "emit"}),
+    (True, {"tokenize", "parse", "fold_constants", "emit"}),
+])
+def test_stages_are_recorded(fold_constants, stages):
+    report = _profile("a:b(1, 2),", fold_constants=fold_constants).get_report()
+
+    assert set(report.stage_seconds) == stages
+    assert all(seconds >= 0 for seconds in report.stage_seconds.values())
+
+
+def test_tokens_and_nodes_are_counted():
+    report = _profile("a:b(1, 2),").get_report()
+
+    assert report.token_counts == {
+        "KEYWORD_SYMBOL": 2,
+        "COLON": 1,
+        "BRACKET_OPEN": 1,
+        "INTEGER": 2,
+        "COMMA": 2,
+        "WHITESPACE": 1,
+        "BRACKET_CLOSE": 1,
+        "EOF": 1,
+    }
+    assert report.node_counts == {
+        "CodeBox": 1,
+        "SendNode": 2,
+        "MyselfNode": 1,
+        "UnfinishedSymbolBox": 2,
+        "LiteralNode": 2,
+        "IntegerBox": 2,
+    }
+    assert (report.source_length, report.module_length) == (10, len(compile_source("a:b(1, 2),")))
+
+
+def test_code_statistics_are_recorded():
+    # root code: 'a', 1, 2 and 'b:' literals; myself, 1 and 2 are on stack at once
+    assert _profile("a:b(1, 2),").get_report().codes == [CodeStatistics(4, 10, 3)]
+
+    # object code is finished before root code which pushes the object
+    assert _profile("(; x(0) = 1, ; 7, ;),").get_report().codes == [CodeStatistics(1, 2, 1), CodeStatistics(1, 2, 1)]
+
+
+def test_json_line_round_trips():
+    profiler = _profile("a:b(1, 2),")
+    output = io.StringIO()
+
+    profiler.write_json_line(output)
+
+    assert output.getvalue().endswith("\n")
+    assert json.loads(output.getvalue()) == json.loads(profiler.to_json_line()) == profiler.to_dict()
+
+    statistics = profiler.to_dict()
+    assert (statistics["code_count"], statistics["literal_count"], statistics["max_stack_usage"]) == (1, 4, 3)
+
+
+def test_cache_hit_is_recorded(tmp_path):
+    cache = CompilationCache(str(tmp_path))
+
+    missed = CompileProfiler()
+    cache.compile("a:b(1, 2),", profiler=missed)
+
+    hit = CompileProfiler()
+    cache.compile("a:b(1, 2),", profiler=hit)
+
+    assert missed.get_report().cache_hit is False
+    assert hit.get_report().cache_hit is True
+
+    # cached module was not compiled again, so there are no stages, only sizes
+    assert hit.get_report().stage_seconds == {}
+    assert hit.get_report().module_length == missed.get_report().module_length
+    assert _profile("a:b(1, 2),").get_report().cache_hit is None
+
+
+def test_driver_writes_line_per_compiled_file(tmp_path):
+    sources = {"a.src": "a:b(1, 2),", "b.src": "b,", "broken.src": "c(,"}
+
+    source_directory = tmp_path / "in"
+    source_directory.mkdir()
+
+    for name, source_code in sources.items():
+        (source_directory / name).write_text(source_code)
+
+    profile_path = tmp_path / "profile.jsonl"
+
+    assert main([str(source_directory), str(tmp_path / "out"), "--workers", "1", "--profile", str(profile_path)]) == 1
+
+    lines = profile_path.read_text().splitlines()
+    profiles = [json.loads(line) for line in lines]
+
+    # failed file has no profile
+    assert [profile["label"] for profile in profiles] == [str(source_directory / name) for name in ("a.src", "b.src")]
+    assert profiles[0]["token_counts"] == _profile("a:b(1, 2),").get_report().token_counts
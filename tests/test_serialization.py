@@ -0,0 +1,89 @@
+import io
+
+import pytest
+
+from source.benchmarks.corpus import CorpusShape, generate_corpus
+from source.compiler.optimization import PeepholeOptimizer
+from source.compiler.parsing import Parser
+from source.compiler.serialization import DecodedCode, DecodedSymbol, ModuleFormatError, StreamingBytecodeWriter, \
+    get_module_bytes, read_module, read_module_bytes, write_module
+from source.compiler.tokenization import Tokenizer
+
+
+def _parse(source_code):
+    return Parser(Tokenizer().tokenize(source_code)).parse_root_code()
+
+
+def _get_module_literals(source_code):
+    return read_module_bytes(get_module_bytes(_parse(source_code))).literals
+
+
+# every string is pushed and pulled right away, so optimizer drops all of them from literal pool
+DROPPED_LITERALS_SOURCE = "".join('"dropped literal {}",\n'.format(index) for index in range(20000)) + "a:b(1),"
+
+
+@pytest.mark.parametrize("optimizer", [None, PeepholeOptimizer()])
+def test_streamed_module_matches_module_bytes(tmp_path, optimizer):
+    root_code = _parse(DROPPED_LITERALS_SOURCE)
+    module_path = tmp_path / "module.ore"
+
+    # output is opened write-only, as any normal caller would
+    with open(module_path, "wb") as module_file:
+        written = write_module(root_code, module_file, chunk_size=1024, optimizer=optimizer)
+
+    module_bytes = module_path.read_bytes()
+
+    assert written == len(module_bytes)
+    assert module_bytes == get_module_bytes(root_code, optimizer)
+
+    if optimizer is not None:
+        assert read_module_bytes(module_bytes).literals == _get_module_literals("a:b(1),")
+
+
+def test_streaming_writer_has_no_bytes():
+    with pytest.raises(io.UnsupportedOperation):
+        StreamingBytecodeWriter(io.BytesIO()).get_bytes()
+
+
+def _random_programs(count):
+    shape = CorpusShape(expression_count=5, nesting_depth=3, send_chain_length=3, slot_count=3, string_length=8)
+
+    return [_parse(generate_corpus(shape, seed)) for seed in range(count)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 4096])
+def test_streamed_module_round_trips(chunk_size):
+    for root_code in _random_programs(100):
+        module_file = io.BytesIO()
+        write_module(root_code, module_file, chunk_size)
+
+        assert module_file.getvalue() == get_module_bytes(root_code)
+        assert read_module(io.BytesIO(module_file.getvalue())) == read_module_bytes(get_module_bytes(root_code))
+
+
+def test_decodes_literals():
+    root_code = read_module_bytes(get_module_bytes(_parse("a:b(1, \"text\"), (; x(0) = 2, ;;),")))
+
+    symbol_a, integer, string, selector, obj = root_code.literals
+
+    assert (symbol_a, integer, string, selector) == (DecodedSymbol(0, "a"), 1, "text", DecodedSymbol(2, "b"))
+    assert obj.code == DecodedCode(0, [], b"")
+    assert [(name, value) for _, name, value in obj.slots] == [(DecodedSymbol(0, "x"), 2)]
+
+
+def test_rejects_truncated_modules():
+    module_bytes = get_module_bytes(_parse("a:b(1, \"text\"), (; x(0) = 2, ;;),"))
+
+    for length in range(len(module_bytes)):
+        with pytest.raises(ModuleFormatError):
+            read_module_bytes(module_bytes[:length])
+
+
+@pytest.mark.parametrize("damage", [
+    lambda module_bytes: b"ORX" + module_bytes[3:],
+    lambda module_bytes: module_bytes + b"\x00",
+    lambda module_bytes: module_bytes[:11] + b"\x63" + module_bytes[12:],
+])
+def test_rejects_damaged_modules(damage):
+    with pytest.raises(ModuleFormatError):
+        read_module_bytes(damage(get_module_bytes(_parse("a,"))))
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from source.compiler import service
+from source.compiler.compilation import compile_source
+from source.compiler.service import CompileClient, CompileService
+
+
+def _run_with_service(socket_path, client_function, **service_options):
+    async def run():
+        compile_service = CompileService(workers=1, **service_options)
+        server_task = asyncio.create_task(compile_service.serve_unix(str(socket_path)))
+
+        while not socket_path.exists():
+            await asyncio.sleep(0.01)
+
+        client = await CompileClient.connect_unix(str(socket_path))
+        try:
+            return await client_function(client)
+        finally:
+            await client.close()
+
+            server_task.cancel()
+            await asyncio.gather(server_task, return_exceptions=True)
+
+    return asyncio.run(run())
+
+
+def test_compiles_inline_and_in_worker(tmp_path):
+    small_source = "a:b(1),"
+    big_source = "a:b(\"{}\"),".format("x" * 5000)
+
+    async def compile_both(client):
+        return await asyncio.gather(client.compile(small_source), client.compile(big_source, optimize=True))
+
+    small_result, big_result = _run_with_service(tmp_path / "service.socket", compile_both)
+
+    assert small_result == (compile_source(small_source), None)
+    assert big_result == (compile_source(big_source, optimize=True), None)
+
+
+def test_reports_diagnostics(tmp_path):
+    async def compile_broken(client):
+        return await asyncio.gather(client.compile("a:b(1,\n  2"), client.compile("1" * 5000 + ","))
+
+    (_, parser_diagnostic), (_, tokenizer_diagnostic) = _run_with_service(tmp_path / "service.socket", compile_broken)
+
+    assert parser_diagnostic["type"] == "ParserError"
+    assert (parser_diagnostic["line"], parser_diagnostic["column"]) == (1, 3)
+    assert tokenizer_diagnostic == {
+        "type": "TokenizerError", "message": "Integer of 5000 digits is too long", "line": 0, "column": 0
+    }
+
+
+def test_unexpected_failure_is_answered(tmp_path, monkeypatch):
+    def failing_compile_request(source, optimize=False, fold_constants=False):
+        raise RuntimeError("compiler bug")
+
+    monkeypatch.setattr(service, "compile_request", failing_compile_request)
+
+    async def compile_twice(client):
+        return await asyncio.gather(client.compile("a,"), client.compile("b,"))
+
+    results = _run_with_service(tmp_path / "service.socket", compile_twice, max_concurrent=1)
+
+    assert results == [(None, {"type": "RuntimeError", "message": "compiler bug"})] * 2
+
+
+def test_refuses_to_replace_regular_file(tmp_path):
+    socket_path = tmp_path / "not-a-socket"
+    socket_path.write_text("keep me")
+
+    with pytest.raises(FileExistsError):
+        asyncio.run(CompileService(workers=1).serve_unix(str(socket_path)))
+
+    assert socket_path.read_text() == "keep me"
@@ -0,0 +1,126 @@
+import random
+
+import pytest
+
+from source.compiler.tokenization import Tokenizer, TokenizerEngines, TokenizerError, TokenTypes, map_source_file
+
+
+SOURCES = [
+    "",
+    "a,",
+    "abc:def(1, \"text\"),",
+    "x + 42 * y,\n\ty <= z,",
+    "(; a(0) = 1, b(1), ; a:b(c), ;)",
+    "(;;) [ ] { } ;) ;] ;} [; {;",
+    "__private_1 Upper CamelCase9,",
+    "\"string with , and ; inside\"",
+    "  \r\n\t  lots   of \n\n  whitespace ",
+    "123456789012345678901234567890",
+    "+-*\\/%=!<>|&",
+]
+
+# characters source fuzz is built from, with some repeated so runs are likely
+_FUZZ_CHARACTERS = "abcXY_09 \t\n\r:,;()[]{}\"+-*/<=|&" + "aaa111   "
+
+
+def _fuzz_sources(count, seed=0):
+    generator = random.Random(seed)
+
+    return [
+        "".join(generator.choice(_FUZZ_CHARACTERS) for _ in range(generator.randrange(40)))
+        for _ in range(count)
+    ]
+
+
+def _tokenize(engine, source_code, collapse_whitespace=False):
+    """Returns tokens, or error arguments when source cannot be tokenized"""
+    try:
+        return Tokenizer(engine, collapse_whitespace).tokenize(source_code)
+    except TokenizerError as error:
+        return error.args
+
+
+def _tokenize_to_buffer(source_code, collapse_whitespace=False):
+    try:
+        return list(Tokenizer(TokenizerEngines.REGEX, collapse_whitespace).tokenize_to_buffer(source_code))
+    except TokenizerError as error:
+        return error.args
+
+
+def _check_engines_agree(source_code, collapse_whitespace):
+    expected = _tokenize(TokenizerEngines.CHARACTER, source_code, collapse_whitespace)
+
+    assert _tokenize(TokenizerEngines.REGEX, source_code, collapse_whitespace) == expected
+    assert _tokenize_to_buffer(source_code, collapse_whitespace) == expected
+
+    # source made of ASCII only has same offsets in bytes
+    assert _tokenize_to_buffer(source_code.encode("utf-8"), collapse_whitespace) == expected
+
+
+@pytest.mark.parametrize("collapse_whitespace", [False, True])
+@pytest.mark.parametrize("source_code", SOURCES)
+def test_engines_produce_same_tokens(source_code, collapse_whitespace):
+    _check_engines_agree(source_code, collapse_whitespace)
+
+
+@pytest.mark.parametrize("collapse_whitespace", [False, True])
+def test_engines_produce_same_tokens_on_fuzzed_sources(collapse_whitespace):
+    for source_code in _fuzz_sources(5000):
+        _check_engines_agree(source_code, collapse_whitespace)
+
+
+def test_token_values_and_offsets():
+    tokens = Tokenizer(TokenizerEngines.REGEX).tokenize("ab:c(12, \"x y\"),")
+
+    assert tokens == [
+        (TokenTypes.KEYWORD_SYMBOL, 0, "ab"),
+        (TokenTypes.COLON, 2, ":"),
+        (TokenTypes.KEYWORD_SYMBOL, 3, "c"),
+        (TokenTypes.BRACKET_OPEN, 4, "("),
+        (TokenTypes.INTEGER, 5, 12),
+        (TokenTypes.COMMA, 7, ","),
+        (TokenTypes.WHITESPACE, 8, " "),
+        (TokenTypes.STRING, 9, "x y"),
+        (TokenTypes.BRACKET_CLOSE, 14, ")"),
+        (TokenTypes.COMMA, 15, ","),
+        (TokenTypes.EOF, 16, ""),
+    ]
+
+
+def test_collapsed_whitespace_is_single_token():
+    tokens = Tokenizer(TokenizerEngines.REGEX, collapse_whitespace=True).tokenize("a \n\t b")
+
+    assert tokens[1] == (TokenTypes.WHITESPACE, 1, " \n\t ")
+
+
+def test_bytes_source_offsets_are_in_bytes():
+    tokens = list(Tokenizer(TokenizerEngines.REGEX).tokenize_to_buffer("\"žluť\",a".encode("utf-8")))
+
+    assert tokens[0] == (TokenTypes.STRING, 0, "žluť")
+    assert tokens[2] == (TokenTypes.KEYWORD_SYMBOL, 9, "a")
+
+
+@pytest.mark.parametrize("source_code, position, message", [
+    ("a,\n  #", (1, 2), "Unexpected character '#'"),
+    ("a,\nb,\n  \"open", (2, 2), "String enclosing quotation marks not found."),
+    ("x\n" + "1" * 5000, (1, 0), "Integer of 5000 digits is too long"),
+])
+def test_error_positions(source_code, position, message):
+    for engine in TokenizerEngines:
+        assert _tokenize(engine, source_code) == (position, message)
+
+    assert _tokenize_to_buffer(source_code) == (position, message)
+
+
+def test_mapped_file_has_content_of_file(tmp_path):
+    source_path = tmp_path / "source.src"
+    source_path.write_bytes("a:b(\"kôň\"),".encode("utf-8"))
+
+    with map_source_file(str(source_path)) as source:
+        assert source[:] == source_path.read_bytes()
+
+    # empty file cannot be memory-mapped, it is handed out as empty bytes instead
+    source_path.write_bytes(b"")
+
+    with map_source_file(str(source_path)) as source:
+        assert source == b""